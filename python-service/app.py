@@ -6,12 +6,38 @@ FastAPI microservice for Python sklearn models
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
+from operator import itemgetter
+from collections import OrderedDict
+import asyncio
+import os
+import threading
+import anyio
 import joblib
 import numpy as np
 from pathlib import Path
+from sklearn.pipeline import Pipeline
 import uvicorn
+import kernels
+
+# ONNX Runtime is optional: fall back to sklearn when not installed
+try:
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+except ImportError:
+    ort = None
+
+# Treelite (+ tl2cgen and a C compiler) is optional: opt in with PREDICT_BACKEND=treelite
+try:
+    import treelite
+    import tl2cgen
+except ImportError:
+    treelite = None
+
+PREDICT_BACKEND = os.getenv('PREDICT_BACKEND', 'onnx')
 
 app = FastAPI(title="NBA ML V3 Service", version="3.0.0")
 
@@ -27,6 +53,70 @@ app.add_middleware(
 # Load models at startup
 MODELS = {}
 SCALERS = {}
+ONNX_SESSIONS = {}
+TREELITE_PREDICTORS = {}
+MEANS = {}
+SCALES = {}
+
+# Feature order expected by the V3 models
+FEATURE_ORDER = (
+    'elo_diff', 'elo_diff_norm', 'home_last10_wins', 'away_last10_wins',
+    'spread_num', 'over_under', 'ml_home_prob', 'ml_away_prob',
+    'rest_days_home', 'rest_days_away', 'season_norm'
+)
+FEATURE_GETTER = itemgetter(*FEATURE_ORDER)
+N_FEATURES = len(FEATURE_ORDER)
+
+def is_fresh(artifact_path, *source_paths):
+    """Check that a cached artifact is at least as new as its sources"""
+    if not artifact_path.exists():
+        return False
+    artifact_mtime = artifact_path.stat().st_mtime
+    return all(artifact_mtime >= p.stat().st_mtime for p in source_paths)
+
+def build_onnx_session(model, scaler, onnx_path, source_paths):
+    """Convert [scaler +] model into a single ONNX graph and open a session"""
+    if is_fresh(onnx_path, *source_paths):
+        onnx_bytes = onnx_path.read_bytes()
+    else:
+        estimator = model if scaler is None else Pipeline([('scaler', scaler), ('model', model)])
+        onx = convert_sklearn(
+            estimator,
+            initial_types=[('X', FloatTensorType([None, N_FEATURES]))],
+            options={id(model): {'zipmap': False}}
+        )
+        onnx_bytes = onx.SerializeToString()
+        
+        # Write then rename so concurrent workers never read a partial file
+        tmp_path = onnx_path.with_name(f'{onnx_path.name}.{os.getpid()}.tmp')
+        try:
+            tmp_path.write_bytes(onnx_bytes)
+            os.replace(tmp_path, onnx_path)
+        except OSError as e:
+            print(f"  Could not cache {onnx_path.name}: {e}")
+    
+    # Single-threaded sessions keep single-row latency low
+    sess_options = ort.SessionOptions()
+    sess_options.intra_op_num_threads = 1
+    return ort.InferenceSession(
+        onnx_bytes,
+        sess_options,
+        providers=['CPUExecutionProvider']
+    )
+
+def build_treelite_predictor(model, libpath, source_paths):
+    """Compile the tree ensemble to a native shared library and load it"""
+    if not is_fresh(libpath, *source_paths):
+        tl_model = treelite.sklearn.import_model(model)
+        tmp_path = libpath.with_name(f'{libpath.stem}.{os.getpid()}.tmp.so')
+        tl2cgen.export_lib(
+            tl_model,
+            toolchain='gcc',
+            libpath=str(tmp_path),
+            params={'parallel_comp': 4, 'quantize': 1}
+        )
+        os.replace(tmp_path, libpath)
+    return tl2cgen.Predictor(str(libpath), nthread=1)
 
 def load_models():
     """Load all available V3 models"""
@@ -39,20 +129,184 @@ def load_models():
             key=lambda x: x.stat().st_mtime,
             reverse=True
         )
-        scaler_files = sorted(
-            models_dir.glob(f'scaler_v3_{model_type}_*.joblib'),
-            key=lambda x: x.stat().st_mtime,
-            reverse=True
-        )
         
-        if model_files and scaler_files:
+        if model_files:
             MODELS[model_type] = joblib.load(model_files[0])
-            SCALERS[model_type] = joblib.load(scaler_files[0])
             print(f"Loaded {model_type} model: {model_files[0].name}")
+            
+            # Older GBM models ship a scaler; histogram GBM models take raw features
+            scaler_path = model_files[0].with_name(model_files[0].name.replace('nba_model_', 'scaler_'))
+            if scaler_path.exists():
+                SCALERS[model_type] = joblib.load(scaler_path)
+                source_paths = (model_files[0], scaler_path)
+                
+                # Scaler coefficients for the in-place sklearn fallback
+                MEANS[model_type] = SCALERS[model_type].mean_.astype(np.float32)
+                SCALES[model_type] = SCALERS[model_type].scale_.astype(np.float32)
+            else:
+                SCALERS[model_type] = None
+                source_paths = (model_files[0],)
+                MEANS[model_type] = np.zeros(N_FEATURES, dtype=np.float32)
+                SCALES[model_type] = np.ones(N_FEATURES, dtype=np.float32)
+            
+            # Compiled artifacts are cached next to the model and reused while fresh
+            if PREDICT_BACKEND == 'treelite' and treelite is not None:
+                try:
+                    TREELITE_PREDICTORS[model_type] = build_treelite_predictor(
+                        MODELS[model_type],
+                        model_files[0].with_suffix('.so'),
+                        source_paths
+                    )
+                    print(f"  Treelite predictor enabled for {model_type}")
+                except Exception as e:
+                    print(f"  Treelite compilation failed for {model_type}: {e}")
+            
+            if model_type not in TREELITE_PREDICTORS and ort is not None:
+                try:
+                    ONNX_SESSIONS[model_type] = build_onnx_session(
+                        MODELS[model_type],
+                        SCALERS[model_type],
+                        model_files[0].with_suffix('.onnx'),
+                        source_paths
+                    )
+                    print(f"  ONNX runtime enabled for {model_type}")
+                except Exception as e:
+                    print(f"  ONNX conversion failed for {model_type}, using sklearn: {e}")
+
+def run_model(model_type, X):
+    """Return (predictions, probabilities) for a raw float32 feature matrix.
+    
+    X is scaled in place on the sklearn path.
+    """
+    session = ONNX_SESSIONS.get(model_type)
+    if session is not None:
+        predictions, probas = session.run(None, {'X': X})
+        return predictions, probas
+    
+    predictor = TREELITE_PREDICTORS.get(model_type)
+    if predictor is not None:
+        # Compiled trees expect scaled inputs and return P(home win)
+        kernels.scale_rows(X, MEANS[model_type], SCALES[model_type])
+        home_probs = predictor.predict(tl2cgen.DMatrix(X)).reshape(-1)
+        probas = np.column_stack([1 - home_probs, home_probs])
+        return (home_probs > 0.5).astype(np.int64), probas
+    
+    # Inline StandardScaler and derive labels from a single predict_proba
+    kernels.scale_rows(X, MEANS[model_type], SCALES[model_type])
+    probas = MODELS[model_type].predict_proba(X)
+    predictions = (probas[:, 1] > 0.5).astype(np.int64)
+    return predictions, probas
+
+class PredictionCache:
+    """Thread-safe LRU of (prediction, home_prob) keyed on model type + feature tuple"""
+    
+    def __init__(self, maxsize=10_000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, model_type, features):
+        key = (model_type, features)
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+    
+    def put(self, model_type, features, result):
+        with self.lock:
+            self.entries[(model_type, features)] = result
+            self.entries.move_to_end((model_type, features))
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+PREDICTION_CACHE = PredictionCache()
+
+class BatchQueue:
+    """Coalesce concurrent single-game requests into one model call"""
+    
+    def __init__(self, max_batch=64, max_wait=0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = None
+        self.task = None
+    
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._worker())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    async def submit(self, model_type, row):
+        """Queue one feature row and wait for (prediction, home_prob)"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((model_type, row, future))
+        return await future
+    
+    async def _collect(self):
+        """Wait for one request, then gather more for up to max_wait"""
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        
+        while len(items) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        return items
+    
+    async def _worker(self):
+        while True:
+            items = await self._collect()
+            
+            # One stacked call per model type
+            groups = {}
+            for item in items:
+                groups.setdefault(item[0], []).append(item)
+            
+            for model_type, group in groups.items():
+                X = np.vstack([row for _, row, _ in group])
+                try:
+                    # Keep CPU-bound inference off the event loop
+                    predictions, probas = await run_in_threadpool(run_model, model_type, X)
+                except Exception as e:
+                    for _, _, future in group:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for i, (_, _, future) in enumerate(group):
+                    if not future.done():
+                        future.set_result((int(predictions[i]), float(probas[i, 1])))
+
+BATCH_QUEUE = BatchQueue()
 
 @app.on_event("startup")
 async def startup():
     load_models()
+    
+    # Pay kernel JIT compilation before the first request
+    kernels.warmup(N_FEATURES)
+    
+    # Size the sync-endpoint threadpool for CPU-bound inference
+    anyio.to_thread.current_default_thread_limiter().total_tokens = os.cpu_count() or 1
+    BATCH_QUEUE.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await BATCH_QUEUE.stop()
 
 # Request/Response models
 class PredictRequest(BaseModel):
@@ -99,7 +353,7 @@ async def health():
     }
 
 @app.post("/predict", response_model=PredictResponse)
-async def predict_batch(request: PredictRequest):
+def predict_batch(request: PredictRequest):
     """Batch prediction endpoint"""
     import time
     start = time.time()
@@ -107,24 +361,27 @@ async def predict_batch(request: PredictRequest):
     if request.model_type not in MODELS:
         raise HTTPException(status_code=400, detail=f"Model {request.model_type} not found")
     
-    model = MODELS[request.model_type]
-    scaler = SCALERS[request.model_type]
+    # Extract features (one itemgetter call per game) and serve cache hits
+    features = [FEATURE_GETTER(g['features']) for g in request.games]
+    results = [PREDICTION_CACHE.get(request.model_type, row) for row in features]
+    misses = [i for i, result in enumerate(results) if result is None]
     
-    # Extract features
-    feature_order = [
-        'elo_diff', 'elo_diff_norm', 'home_last10_wins', 'away_last10_wins',
-        'spread_num', 'over_under', 'ml_home_prob', 'ml_away_prob',
-        'rest_days_home', 'rest_days_away', 'season_norm'
-    ]
-    
-    X = np.array([[g['features'][f] for f in feature_order] for g in request.games])
-    X_scaled = scaler.transform(X)
+    # Predict only the games not already cached
+    if misses:
+        X = np.fromiter(
+            (v for i in misses for v in features[i]),
+            dtype=np.float32,
+            count=len(misses) * N_FEATURES
+        ).reshape(len(misses), N_FEATURES)
+        miss_predictions, miss_probas = run_model(request.model_type, X)
+        
+        for j, i in enumerate(misses):
+            results[i] = (int(miss_predictions[j]), float(miss_probas[j, 1]))
+            PREDICTION_CACHE.put(request.model_type, features[i], results[i])
     
-    # Predict
-    predictions = model.predict(X_scaled).tolist()
-    probas = model.predict_proba(X_scaled)
-    home_probs = probas[:, 1].tolist()
-    confidences = [abs(p - 0.5) * 2 for p in home_probs]
+    predictions = [prediction for prediction, _ in results]
+    home_probs = [home_prob for _, home_prob in results]
+    confidences = kernels.confidence(np.array(home_probs)).tolist()
     
     latency = (time.time() - start) * 1000
     
@@ -145,22 +402,21 @@ async def predict_single(request: SinglePredictRequest):
     if request.model_type not in MODELS:
         raise HTTPException(status_code=400, detail=f"Model {request.model_type} not found")
     
-    model = MODELS[request.model_type]
-    scaler = SCALERS[request.model_type]
-    
     # Extract features
     f = request.features
-    X = np.array([[
+    features = (
         f.elo_diff, f.elo_diff_norm, f.home_last10_wins, f.away_last10_wins,
         f.spread_num, f.over_under, f.ml_home_prob, f.ml_away_prob,
         f.rest_days_home, f.rest_days_away, f.season_norm
-    ]])
-    X_scaled = scaler.transform(X)
+    )
     
-    # Predict
-    prediction = int(model.predict(X_scaled)[0])
-    proba = model.predict_proba(X_scaled)[0]
-    home_prob = float(proba[1])
+    # Predict (cache first, then batched with other in-flight single requests)
+    result = PREDICTION_CACHE.get(request.model_type, features)
+    if result is None:
+        X = np.array([features], dtype=np.float32)
+        result = await BATCH_QUEUE.submit(request.model_type, X)
+        PREDICTION_CACHE.put(request.model_type, features, result)
+    prediction, home_prob = result
     confidence = abs(home_prob - 0.5) * 2
     
     latency = (time.time() - start) * 1000
@@ -178,10 +434,13 @@ async def list_models():
     return {
         "available_models": list(MODELS.keys()),
         "models": {
+            # GradientBoosting has n_estimators, HistGradientBoosting max_iter/n_iter_
             k: {
-                "n_estimators": v.n_estimators,
-                "max_depth": v.max_depth,
-                "learning_rate": v.learning_rate
+                "n_estimators": getattr(v, "n_estimators", None),
+                "max_iter": getattr(v, "max_iter", None),
+                "n_iter": getattr(v, "n_iter_", None),
+                "max_depth": getattr(v, "max_depth", None),
+                "learning_rate": getattr(v, "learning_rate", None)
             } for k, v in MODELS.items()
         }
     }
@@ -190,4 +449,7 @@ if __name__ == "__main__":
     print("Starting NBA ML V3 Python Service")
     print("API available at: http://localhost:8000")
     print("Docs available at: http://localhost:8000/docs")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    # One worker process per core; each worker loads its own models
+    workers = int(os.getenv('UVICORN_WORKERS', os.cpu_count() or 1))
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=workers)
@@ -0,0 +1,42 @@
+"""
+Numba kernels for the prediction hot path
+Falls back to plain NumPy when numba is not installed
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def scale_rows(X, mean, scale):
+        """Standardize X in place: (x - mean) / scale per column"""
+        for i in range(X.shape[0]):
+            for j in range(X.shape[1]):
+                X[i, j] = (X[i, j] - mean[j]) / scale[j]
+
+    @njit(cache=True, fastmath=True)
+    def confidence(probs):
+        """Confidence as distance from a coin flip: |p - 0.5| * 2"""
+        out = np.empty_like(probs)
+        for i in range(probs.shape[0]):
+            out[i] = abs(probs[i] - 0.5) * 2
+        return out
+else:
+    def scale_rows(X, mean, scale):
+        """Standardize X in place: (x - mean) / scale per column"""
+        np.subtract(X, mean, out=X)
+        np.divide(X, scale, out=X)
+
+    def confidence(probs):
+        """Confidence as distance from a coin flip: |p - 0.5| * 2"""
+        return np.abs(probs - 0.5) * 2
+
+def warmup(n_features):
+    """Trigger JIT compilation for the dtypes used by the service"""
+    X = np.zeros((1, n_features), dtype=np.float32)
+    scale_rows(X, np.zeros(n_features, dtype=np.float32), np.ones(n_features, dtype=np.float32))
+    confidence(np.zeros(1, dtype=np.float64))
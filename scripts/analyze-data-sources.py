@@ -5,7 +5,10 @@ Check structure, team names, dates to find merge issues
 """
 
 import duckdb
-import pandas as pd
+
+def fetch_column(conn, query):
+    """Run a query and return its first column as a list (no DataFrame)"""
+    return [row[0] for row in conn.execute(query).fetchall()]
 
 def analyze_database():
     print('='*70)
@@ -19,18 +22,18 @@ def analyze_database():
     print('-'*70)
     
     games_sample = conn.execute('''
-        SELECT * FROM github_games LIMIT 5
+        SELECT season, date, home_team, away_team, home_score, away_score
+        FROM github_games LIMIT 5
     ''').fetchdf()
     
     print('Sample rows:')
-    print(games_sample[['season', 'date', 'home_team', 'away_team', 'home_score', 'away_score']].to_string())
+    print(games_sample.to_string())
     
     print('\nUnique seasons:', conn.execute('SELECT DISTINCT season FROM github_games ORDER BY season').fetchall())
     print('Total games:', conn.execute('SELECT COUNT(*) FROM github_games').fetchone()[0])
     
     print('\nUnique home teams (first 10):')
-    teams = conn.execute('SELECT DISTINCT home_team FROM github_games LIMIT 10').fetchdf()
-    for team in teams['home_team']:
+    for team in fetch_column(conn, 'SELECT DISTINCT home_team FROM github_games LIMIT 10'):
         print(f'  - "{team}"')
     
     print('\nDate range:')
@@ -43,18 +46,18 @@ def analyze_database():
     print('-'*70)
     
     odds_sample = conn.execute('''
-        SELECT * FROM odds_historical LIMIT 5
+        SELECT season, date, home_team, away_team, spread, over_under
+        FROM odds_historical LIMIT 5
     ''').fetchdf()
     
     print('Sample rows:')
-    print(odds_sample[['season', 'date', 'home_team', 'away_team', 'spread', 'over_under']].to_string())
+    print(odds_sample.to_string())
     
     print('\nUnique seasons:', conn.execute('SELECT DISTINCT season FROM odds_historical ORDER BY season').fetchall())
     print('Total odds entries:', conn.execute('SELECT COUNT(*) FROM odds_historical').fetchone()[0])
     
     print('\nUnique home teams (first 10):')
-    teams = conn.execute('SELECT DISTINCT home_team FROM odds_historical LIMIT 10').fetchdf()
-    for team in teams['home_team']:
+    for team in fetch_column(conn, 'SELECT DISTINCT home_team FROM odds_historical LIMIT 10'):
         print(f'  - "{team}"')
     
     print('\nDate range:')
@@ -66,24 +69,24 @@ def analyze_database():
     print('\n\n3. VERIFICATION DES CORRESPONDANCES')
     print('-'*70)
     
-    games_teams = conn.execute('SELECT DISTINCT home_team FROM github_games').fetchdf()['home_team'].tolist()
-    odds_teams = conn.execute('SELECT DISTINCT home_team FROM odds_historical').fetchdf()['home_team'].tolist()
+    n_games_teams = conn.execute('SELECT COUNT(DISTINCT home_team) FROM github_games').fetchone()[0]
+    n_odds_teams = conn.execute('SELECT COUNT(DISTINCT home_team) FROM odds_historical').fetchone()[0]
     
-    print(f'Teams in games: {len(games_teams)}')
-    print(f'Teams in odds: {len(odds_teams)}')
+    print(f'Teams in games: {n_games_teams}')
+    print(f'Teams in odds: {n_odds_teams}')
     
-    # Normalize and compare
-    games_teams_clean = [t.strip().lower() for t in games_teams]
-    odds_teams_clean = [t.strip().lower() for t in odds_teams]
+    # Normalize and compare in SQL; only the final lists reach Python
+    games_clean = 'SELECT DISTINCT LOWER(TRIM(home_team)) FROM github_games'
+    odds_clean = 'SELECT DISTINCT LOWER(TRIM(home_team)) FROM odds_historical'
     
     print('\nSample team comparison:')
-    print('Games teams (first 5):', games_teams_clean[:5])
-    print('Odds teams (first 5):', odds_teams_clean[:5])
+    print('Games teams (first 5):', fetch_column(conn, f'{games_clean} LIMIT 5'))
+    print('Odds teams (first 5):', fetch_column(conn, f'{odds_clean} LIMIT 5'))
     
     # Find matching teams
-    common_teams = set(games_teams_clean) & set(odds_teams_clean)
-    games_only = set(games_teams_clean) - set(odds_teams_clean)
-    odds_only = set(odds_teams_clean) - set(games_teams_clean)
+    common_teams = fetch_column(conn, f'{games_clean} INTERSECT {odds_clean}')
+    games_only = fetch_column(conn, f'{games_clean} EXCEPT {odds_clean} ORDER BY 1')
+    odds_only = fetch_column(conn, f'{odds_clean} EXCEPT {games_clean} ORDER BY 1')
     
     print(f'\nCommon teams: {len(common_teams)}')
     print(f'Teams only in games: {len(games_only)}')
@@ -91,26 +94,31 @@ def analyze_database():
     
     if games_only:
         print('\nTeams only in games (first 10):')
-        for team in sorted(games_only)[:10]:
+        for team in games_only[:10]:
             print(f'  - "{team}"')
     
     if odds_only:
         print('\nTeams only in odds (first 10):')
-        for team in sorted(odds_only)[:10]:
+        for team in odds_only[:10]:
             print(f'  - "{team}"')
     
     # 4. Check season overlap
     print('\n\n4. CHEVAUCHEMENT DES SAISONS')
     print('-'*70)
     
-    games_seasons = conn.execute('SELECT DISTINCT season FROM github_games ORDER BY season').fetchdf()['season'].tolist()
-    odds_seasons = conn.execute('SELECT DISTINCT season FROM odds_historical ORDER BY season').fetchdf()['season'].tolist()
+    games_seasons = fetch_column(conn, 'SELECT DISTINCT season FROM github_games ORDER BY season')
+    odds_seasons = fetch_column(conn, 'SELECT DISTINCT season FROM odds_historical ORDER BY season')
     
     print('Games seasons:', games_seasons)
     print('Odds seasons:', odds_seasons)
     
-    common_seasons = set(games_seasons) & set(odds_seasons)
-    print(f'\nCommon seasons: {sorted(common_seasons)}')
+    common_seasons = fetch_column(conn, '''
+        SELECT season FROM github_games
+        INTERSECT
+        SELECT season FROM odds_historical
+        ORDER BY season
+    ''')
+    print(f'\nCommon seasons: {common_seasons}')
     
     # 5. Test merge on one season
     print('\n\n5. TEST DE MERGE (Saison 2010)')
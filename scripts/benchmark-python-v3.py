@@ -42,11 +42,29 @@ Output JSON format:
 import sys
 import json
 import time
+from functools import lru_cache
+from operator import itemgetter
 import numpy as np
 import joblib
 from pathlib import Path
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score, log_loss
 
+FEATURE_ORDER = (
+    'elo_diff',
+    'elo_diff_norm',
+    'home_last10_wins',
+    'away_last10_wins',
+    'spread_num',
+    'over_under',
+    'ml_home_prob',
+    'ml_away_prob',
+    'rest_days_home',
+    'rest_days_away',
+    'season_norm'
+)
+FEATURE_GETTER = itemgetter(*FEATURE_ORDER)
+
+@lru_cache(maxsize=4)
 def find_latest_model(model_type):
     """Find the latest model file for given type"""
     models_dir = Path('./models')
@@ -56,54 +74,46 @@ def find_latest_model(model_type):
         raise FileNotFoundError(f"No model found for type: {model_type}")
     return files[0]
 
-def find_latest_scaler(model_type):
-    """Find the latest scaler file for given type"""
-    models_dir = Path('./models')
-    pattern = f'scaler_v3_{model_type}_*.joblib'
-    files = sorted(models_dir.glob(pattern), key=lambda x: x.stat().st_mtime, reverse=True)
-    if not files:
-        raise FileNotFoundError(f"No scaler found for type: {model_type}")
-    return files[0]
+def find_model_scaler(model_path):
+    """Scaler saved with a model, or None (histogram GBM models take raw features)"""
+    scaler_path = model_path.with_name(model_path.name.replace('nba_model_', 'scaler_'))
+    return scaler_path if scaler_path.exists() else None
 
 def load_model_and_scaler(model_type):
-    """Load model and scaler from joblib files"""
+    """Load model and (optional) scaler from joblib files"""
     model_path = find_latest_model(model_type)
-    scaler_path = find_latest_scaler(model_type)
+    scaler_path = find_model_scaler(model_path)
     
     print(f"Loading model: {model_path.name}", file=sys.stderr)
-    print(f"Loading scaler: {scaler_path.name}", file=sys.stderr)
-    
     model = joblib.load(model_path)
-    scaler = joblib.load(scaler_path)
     
-    return model, scaler
+    scaler = None
+    if scaler_path is not None:
+        print(f"Loading scaler: {scaler_path.name}", file=sys.stderr)
+        scaler = joblib.load(scaler_path)
+    
+    return model, scaler, model_path, scaler_path
 
 def prepare_features(game_data):
     """Extract features in correct order"""
-    feature_order = [
-        'elo_diff',
-        'elo_diff_norm',
-        'home_last10_wins',
-        'away_last10_wins',
-        'spread_num',
-        'over_under',
-        'ml_home_prob',
-        'ml_away_prob',
-        'rest_days_home',
-        'rest_days_away',
-        'season_norm'
-    ]
-    
-    features = []
-    for game in game_data['games']:
-        row = [game['features'][f] for f in feature_order]
-        features.append(row)
-    
-    return np.array(features)
+    games = game_data['games']
+    n_features = len(FEATURE_ORDER)
+    
+    X = np.fromiter(
+        (v for game in games for v in FEATURE_GETTER(game['features'])),
+        dtype=np.float32,
+        count=len(games) * n_features
+    )
+    return X.reshape(len(games), n_features)
 
 def calculate_metrics(y_true, y_pred, y_proba):
     """Calculate all metrics"""
-    y_true_binary = np.array([1 if y else 0 for y in y_true])
+    y_true_binary = np.asarray(y_true, dtype=np.int8)
+    
+    # Two-column probabilities for log_loss, filled in place
+    proba_2d = np.empty((len(y_proba), 2), dtype=np.float64)
+    proba_2d[:, 1] = y_proba
+    np.subtract(1, y_proba, out=proba_2d[:, 0])
     
     return {
         'accuracy': accuracy_score(y_true_binary, y_pred),
@@ -111,7 +121,7 @@ def calculate_metrics(y_true, y_pred, y_proba):
         'recall': float(recall_score(y_true_binary, y_pred, zero_division=0)),
         'f1': float(f1_score(y_true_binary, y_pred, zero_division=0)),
         'auc': roc_auc_score(y_true_binary, y_proba),
-        'log_loss': log_loss(y_true_binary, np.column_stack([1 - y_proba, y_proba]))
+        'log_loss': log_loss(y_true_binary, proba_2d)
     }
 
 def main():
@@ -133,7 +143,7 @@ def main():
     
     # Load model
     try:
-        model, scaler = load_model_and_scaler(model_type)
+        model, scaler, model_path, _ = load_model_and_scaler(model_type)
     except FileNotFoundError as e:
         print(json.dumps({"error": str(e)}), file=sys.stdout)
         sys.exit(1)
@@ -141,8 +151,8 @@ def main():
     # Prepare features
     X = prepare_features(input_data)
     
-    # Scale features
-    X_scaled = scaler.transform(X)
+    # Scale features in place, keeping float32 (the GBM's native split dtype)
+    X_scaled = X if scaler is None else scaler.transform(X, copy=False)
     
     # Make predictions
     prediction_start = time.time()
@@ -159,7 +169,7 @@ def main():
     
     output = {
         'model_type': model_type,
-        'model_file': find_latest_model(model_type).name,
+        'model_file': model_path.name,
         'num_games': len(games),
         'predictions': predictions.tolist(),
         'probabilities': probabilities.tolist(),
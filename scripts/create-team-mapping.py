@@ -65,12 +65,11 @@ def create_mapping_table():
         )
     ''')
     
-    # Insert mappings
-    for abbr, name in TEAM_MAPPING.items():
-        conn.execute(f"""
-            INSERT INTO team_mapping (abbreviation, full_name)
-            VALUES ('{abbr}', '{name.replace("'", "''")}')
-        """)
+    # Insert mappings (one prepared statement, bound values)
+    conn.executemany(
+        'INSERT INTO team_mapping (abbreviation, full_name) VALUES (?, ?)',
+        list(TEAM_MAPPING.items())
+    )
     
     conn.commit()
     
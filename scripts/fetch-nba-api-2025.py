@@ -17,10 +17,12 @@ except ImportError:
     from nba_api.stats.endpoints import leaguegamefinder
     from nba_api.stats.library.parameters import Season
 
+import asyncio
 import duckdb
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 from datetime import datetime
-import time
 
 class NBAAPIDataFetcher:
     def __init__(self):
@@ -51,43 +53,54 @@ class NBAAPIDataFetcher:
             print(f'  Error: {e}')
             return pd.DataFrame()
     
+    async def fetch_seasons(self, seasons):
+        """Fetch seasons concurrently, at most two API requests in flight"""
+        # Rate limiting
+        semaphore = asyncio.Semaphore(2)
+        
+        async def fetch_limited(season_str):
+            async with semaphore:
+                return await asyncio.to_thread(self.fetch_season, season_str)
+        
+        return await asyncio.gather(*(fetch_limited(season_str) for season_str, _ in seasons))
+    
     def process_games(self, games_df, season_year):
         """Process games into standard format"""
         print(f'\nProcessing games for {season_year}...')
         
-        # Group by game_id to get both teams
-        games_list = []
-        
-        for game_id in games_df['GAME_ID'].unique():
-            game_teams = games_df[games_df['GAME_ID'] == game_id]
-            
-            if len(game_teams) != 2:
-                continue
-            
-            # Identify home and away
-            home_team = game_teams[game_teams['MATCHUP'].str.contains('vs.')]
-            away_team = game_teams[game_teams['MATCHUP'].str.contains('@')]
-            
-            if len(home_team) != 1 or len(away_team) != 1:
-                continue
-            
-            home = home_team.iloc[0]
-            away = away_team.iloc[0]
-            
-            games_list.append({
-                'game_id': game_id,
-                'date': pd.to_datetime(home['GAME_DATE']).strftime('%Y-%m-%d'),
-                'season': season_year,
-                'home_team': home['TEAM_NAME'],
-                'away_team': away['TEAM_NAME'],
-                'home_score': home['PTS'],
-                'away_score': away['PTS'],
-                'winner': home['TEAM_NAME'] if home['PTS'] > away['PTS'] else away['TEAM_NAME'],
-                'home_win': 1 if home['PTS'] > away['PTS'] else 0,
-                'source': 'nba_api'
-            })
-        
-        result_df = pd.DataFrame(games_list)
+        # Classify home/away once for the whole season (plain substring match)
+        games_df = games_df.assign(
+            is_home=games_df['MATCHUP'].str.contains('vs.', regex=False),
+            is_away=games_df['MATCHUP'].str.contains('@', regex=False)
+        )
+        
+        # Keep games with exactly two rows: one home, one away
+        grouped = games_df.groupby('GAME_ID', sort=False)
+        valid = (
+            (grouped['GAME_ID'].transform('size') == 2) &
+            (grouped['is_home'].transform('sum') == 1) &
+            (grouped['is_away'].transform('sum') == 1)
+        )
+        games_df = games_df[valid]
+        
+        # Align home and away rows by game, in first-seen order
+        game_ids = games_df['GAME_ID'].drop_duplicates()
+        home = games_df[games_df['is_home']].set_index('GAME_ID').reindex(game_ids)
+        away = games_df[games_df['is_away']].set_index('GAME_ID').reindex(game_ids)
+        home_won = (home['PTS'] > away['PTS']).to_numpy()
+        
+        result_df = pd.DataFrame({
+            'game_id': game_ids.to_numpy(),
+            'date': pd.to_datetime(home['GAME_DATE']).dt.strftime('%Y-%m-%d').to_numpy(),
+            'season': season_year,
+            'home_team': home['TEAM_NAME'].to_numpy(),
+            'away_team': away['TEAM_NAME'].to_numpy(),
+            'home_score': home['PTS'].to_numpy(),
+            'away_score': away['PTS'].to_numpy(),
+            'winner': np.where(home_won, home['TEAM_NAME'], away['TEAM_NAME']),
+            'home_win': home_won.astype(np.int64),
+            'source': 'nba_api'
+        })
         print(f'  Processed {len(result_df)} games')
         return result_df
     
@@ -115,13 +128,18 @@ class NBAAPIDataFetcher:
         # Delete existing data for this season
         conn.execute(f"DELETE FROM nba_api_games WHERE season = {season_year}")
         
-        # Insert new data
+        # Insert new data (columnar Arrow scan, date parsed before DuckDB sees it)
         if len(games_df) > 0:
-            conn.execute(f"""
+            games_tbl = pa.Table.from_pandas(games_df, preserve_index=False)
+            date_idx = games_tbl.schema.get_field_index('date')
+            games_tbl = games_tbl.set_column(date_idx, 'date', games_tbl['date'].cast(pa.date32()))
+            conn.register('games_tbl', games_tbl)
+            
+            conn.execute("""
                 INSERT INTO nba_api_games 
                 SELECT 
                     game_id,
-                    date::DATE,
+                    date,
                     season,
                     home_team,
                     away_team,
@@ -130,8 +148,9 @@ class NBAAPIDataFetcher:
                     winner,
                     source,
                     CURRENT_TIMESTAMP
-                FROM games_df
+                FROM games_tbl
             """)
+            conn.unregister('games_tbl')
             
             conn.commit()
             
@@ -154,14 +173,14 @@ class NBAAPIDataFetcher:
         
         total_games = 0
         
-        for season_str, season_year in seasons_to_fetch:
+        # Fetch (network-bound, overlapped across seasons)
+        raw_seasons = asyncio.run(self.fetch_seasons(seasons_to_fetch))
+        
+        for (season_str, season_year), raw_games in zip(seasons_to_fetch, raw_seasons):
             print(f'\n{"="*70}')
             print(f'SEASON: {season_str}')
             print(f'{"="*70}')
             
-            # Fetch
-            raw_games = self.fetch_season(season_str)
-            
             if len(raw_games) == 0:
                 print(f'  No data found for {season_str}')
                 continue
@@ -173,9 +192,6 @@ class NBAAPIDataFetcher:
             self.save_to_db(processed_games, season_year)
             
             total_games += len(processed_games)
-            
-            # Rate limiting
-            time.sleep(1)
         
         print(f'\n{"="*70}')
         print(f'TOTAL GAMES FETCHED: {total_games}')
@@ -5,7 +5,6 @@ Source: Neil-Paine-1/NBA-elo GitHub
 """
 
 import duckdb
-import pandas as pd
 from datetime import datetime
 
 # Team mapping from abbreviations to full names
@@ -63,74 +62,66 @@ print('='*70)
 print('IMPORT ELO COMPLET 2016-2025')
 print('='*70)
 
-# Load ELO data
-print('\n1. Loading ELO CSV from GitHub...')
-df_elo = pd.read_csv('data/nba_elo_github.csv')
-print(f'   Total ELO entries: {len(df_elo)}')
-
-# Filter for seasons we need (2016-2025)
-df_elo = df_elo[df_elo['season'].between(2016, 2025)]
-print(f'   ELO entries 2016-2025: {len(df_elo)}')
-
-# Map team abbreviations to full names
-print('\n2. Mapping team names...')
-df_elo['home_team_full'] = df_elo['team1'].map(TEAM_MAP)
-df_elo['away_team_full'] = df_elo['team2'].map(TEAM_MAP)
-
-# Check for unmapped teams
-unmapped = df_elo[df_elo['home_team_full'].isna()]['team1'].unique()
-if len(unmapped) > 0:
-    print(f'   Warning: Unmapped teams: {unmapped}')
+ELO_CSV = 'data/nba_elo_github.csv'
+ELO_PARQUET = 'data/nba_elo_2016_2025.parquet'
 
 # Connect to database
-print('\n3. Connecting to database...')
+print('\n1. Connecting to database...')
 conn = duckdb.connect('./nba-data/analytics.duckdb')
 
-# Create temporary table for ELO data
-print('\n4. Creating ELO staging table...')
+# Team mapping as a lookup table for the staging join
+conn.execute('CREATE OR REPLACE TEMP TABLE team_map (abbr VARCHAR, full_name VARCHAR)')
+conn.executemany('INSERT INTO team_map VALUES (?, ?)', list(TEAM_MAP.items()))
+
+# Load ELO data
+print('\n2. Loading ELO CSV from GitHub...')
+conn.execute(f'''
+    CREATE OR REPLACE TEMP TABLE elo_raw AS
+    SELECT *, row_number() OVER () AS csv_row FROM read_csv_auto('{ELO_CSV}')
+''')
+total = conn.execute('SELECT COUNT(*) FROM elo_raw').fetchone()[0]
+print(f'   Total ELO entries: {total}')
+
+# Filter seasons (2016-2025) and map team names while loading.
+# Rows keep CSV order so the UPDATE below resolves repeated matchups as before.
+print('\n3. Creating ELO staging table...')
+# Staging and the github_games update commit together
+conn.execute('BEGIN TRANSACTION')
 conn.execute('DROP TABLE IF EXISTS elo_staging')
 conn.execute('''
-    CREATE TABLE elo_staging (
-        date DATE,
-        season INTEGER,
-        team1 VARCHAR,
-        team2 VARCHAR,
-        home_team_full VARCHAR,
-        away_team_full VARCHAR,
-        elo1_pre FLOAT,
-        elo2_pre FLOAT,
-        elo1_post FLOAT,
-        elo2_post FLOAT,
-        score1 INTEGER,
-        score2 INTEGER
-    )
+    CREATE TEMP TABLE elo_staging AS
+    SELECT 
+        e.date::DATE AS date,
+        e.season::INTEGER AS season,
+        e.team1::VARCHAR AS team1,
+        e.team2::VARCHAR AS team2,
+        COALESCE(m1.full_name, '') AS home_team_full,
+        COALESCE(m2.full_name, '') AS away_team_full,
+        e.elo1_pre::FLOAT AS elo1_pre,
+        e.elo2_pre::FLOAT AS elo2_pre,
+        e.elo1_post::FLOAT AS elo1_post,
+        e.elo2_post::FLOAT AS elo2_post,
+        e.score1::INTEGER AS score1,
+        e.score2::INTEGER AS score2
+    FROM elo_raw e
+    LEFT JOIN team_map m1 ON m1.abbr = e.team1
+    LEFT JOIN team_map m2 ON m2.abbr = e.team2
+    WHERE e.season BETWEEN 2016 AND 2025
+    ORDER BY e.csv_row
 ''')
 
-# Insert ELO data
-print('\n5. Inserting ELO data...')
-for _, row in df_elo.iterrows():
-    conn.execute(f'''
-        INSERT INTO elo_staging VALUES (
-            '{row['date']}',
-            {row['season']},
-            '{row['team1']}',
-            '{row['team2']}',
-            '{row['home_team_full'] if pd.notna(row['home_team_full']) else ''}',
-            '{row['away_team_full'] if pd.notna(row['away_team_full']) else ''}',
-            {row['elo1_pre']},
-            {row['elo2_pre']},
-            {row['elo1_post']},
-            {row['elo2_post']},
-            {row['score1']},
-            {row['score2']}
-        )
-    ''')
-
 count = conn.execute('SELECT COUNT(*) FROM elo_staging').fetchone()[0]
-print(f'   Inserted {count} ELO records')
+print(f'   ELO entries 2016-2025: {count}')
+
+# Check for unmapped teams
+unmapped = [row[0] for row in conn.execute('''
+    SELECT DISTINCT team1 FROM elo_staging WHERE home_team_full = '' ORDER BY team1
+''').fetchall()]
+if len(unmapped) > 0:
+    print(f'   Warning: Unmapped teams: {unmapped}')
 
 # Update github_games with ELO
-print('\n6. Updating github_games with ELO...')
+print('\n4. Updating github_games with ELO...')
 
 # Update 2016-2025 seasons
 conn.execute('''
@@ -150,9 +141,16 @@ conn.execute('''
         (g.home_team = e.team1 AND g.away_team = e.team2)
     )
 ''')
+conn.execute('COMMIT')
+
+# Parquet snapshot of the filtered, name-mapped ELO rows
+conn.execute(f'''
+    COPY elo_staging TO '{ELO_PARQUET}' (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 100000)
+''')
+print(f'   Snapshot written to {ELO_PARQUET}')
 
 # Check results
-print('\n7. Verification...')
+print('\n5. Verification...')
 result = conn.execute('''
     SELECT 
         season,
@@ -161,10 +159,11 @@ result = conn.execute('''
     FROM github_games
     GROUP BY season
     ORDER BY season
-''').fetchdf()
+''').fetchall()
 
 print('\n   ELO Coverage after update:')
-print(result.to_string(index=False))
+for season, total, with_elo in result:
+    print(f'   {season}: {with_elo} / {total}')
 
 # Calculate missing
 missing = conn.execute('''
@@ -173,11 +172,12 @@ missing = conn.execute('''
     WHERE elo_home_before IS NULL
     GROUP BY season
     ORDER BY season
-''').fetchdf()
+''').fetchall()
 
 if len(missing) > 0:
     print('\n   Still missing ELO:')
-    print(missing.to_string(index=False))
+    for season, n_missing in missing:
+        print(f'   {season}: {n_missing}')
 else:
     print('\n   ✅ All games now have ELO!')
 
@@ -10,7 +10,28 @@ import duckdb
 import os
 import sys
 import re
-from datetime import datetime
+import pandas as pd
+
+# Season tables are named like odds_2019-20
+ODDS_TABLE_RE = re.compile(r'odds_(\d{4})-\d{2}')
+
+# DuckDB memory cap for the bulk insert: far above the few MB of odds history, so it never spills
+IMPORT_MEMORY_LIMIT = '2GB'
+
+# Source columns and the values used when a season table lacks them
+SOURCE_DEFAULTS = {
+    'Date': '',
+    'Home': '',
+    'Away': '',
+    'OU': 0,
+    'Spread': 0,
+    'ML_Home': '',
+    'ML_Away': '',
+    'Points': 0,
+    'Win_Margin': 0,
+    'Days_Rest_Home': 0,
+    'Days_Rest_Away': 0
+}
 
 def get_season_tables(db_path):
     """Get list of odds tables from the database, sorted by season"""
@@ -22,7 +43,7 @@ def get_season_tables(db_path):
     
     season_tables = []
     for (table_name,) in tables:
-        match = re.match(r'odds_(\d{4})-\d{2}', table_name)
+        match = ODDS_TABLE_RE.match(table_name)
         if match:
             season = int(match.group(1))
             if season >= 2010:
@@ -34,25 +55,78 @@ def get_season_tables(db_path):
     conn.close()
     return sorted(season_tables, key=lambda x: x['season'])
 
-def parse_date(date_str):
-    """Parse date from various formats"""
-    try:
-        # Try different date formats
-        for fmt in ['%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y']:
-            try:
-                dt = datetime.strptime(date_str, fmt)
-                return dt.strftime('%Y-%m-%d')
-            except:
-                continue
-    except:
-        pass
-    return date_str  # Return original if parsing fails
+def build_table_query(sqlite_conn, table):
+    """Select one season table, filling missing columns with defaults"""
+    present = {row[1] for row in sqlite_conn.execute(f'PRAGMA table_info("{table["name"]}")')}
+    columns = []
+    params = []
+    for col, default in SOURCE_DEFAULTS.items():
+        if col in present:
+            columns.append(f'"{col}"')
+        else:
+            columns.append(f'? AS "{col}"')
+            params.append(default)
+    
+    return f'SELECT {table["season"]} AS season, {", ".join(columns)} FROM "{table["name"]}"', params
+
+def build_union_query(sqlite_conn, tables):
+    """Select all season tables in one UNION ALL"""
+    selects = []
+    params = []
+    for table in tables:
+        select, table_params = build_table_query(sqlite_conn, table)
+        selects.append(select)
+        params.extend(table_params)
+    
+    return ' UNION ALL '.join(selects), params
+
+def read_odds(sqlite_conn, query, params):
+    """Run a season query and normalize the rows into the odds_historical layout"""
+    cursor = sqlite_conn.execute(query, params)
+    
+    # Keep raw SQLite values (object dtype) so text columns match str() of the source
+    columns = [description[0] for description in cursor.description]
+    df = pd.DataFrame(cursor.fetchall(), columns=columns, dtype=object)
+    
+    # Normalize whole columns at once
+    return pd.DataFrame({
+        'season': df['season'].astype(int),
+        'date': parse_dates(df['Date']),
+        'home_team': df['Home'],
+        'away_team': df['Away'],
+        'over_under': pd.to_numeric(df['OU'], errors='coerce').fillna(0).astype(float),
+        'spread': pd.to_numeric(df['Spread'], errors='coerce').fillna(0).astype(float),
+        'ml_home': df['ML_Home'].map(str),
+        'ml_away': df['ML_Away'].map(str),
+        'total_points': pd.to_numeric(df['Points'], errors='coerce').fillna(0).astype(int),
+        'win_margin': pd.to_numeric(df['Win_Margin'], errors='coerce').fillna(0).astype(int),
+        'days_rest_home': pd.to_numeric(df['Days_Rest_Home'], errors='coerce').fillna(0).astype(int),
+        'days_rest_away': pd.to_numeric(df['Days_Rest_Away'], errors='coerce').fillna(0).astype(int),
+        'source': 'kyleskom'
+    })
+
+def parse_dates(dates):
+    """Parse a column of dates from various formats to YYYY-MM-DD"""
+    # Most rows are ISO already; only retry the leftovers with the slower formats
+    parsed = pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce')
+    for fmt in ['%m/%d/%Y', '%m/%d/%y']:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed = parsed.combine_first(pd.to_datetime(dates[missing], format=fmt, errors='coerce'))
+    
+    # Keep the original value where no format matched
+    result = dates.copy()
+    matched = parsed.notna()
+    result[matched] = parsed[matched].dt.strftime('%Y-%m-%d')
+    return result
 
 def import_data():
     """Main import function"""
     data_dir = './data/github-odds'
     db_path = os.path.join(data_dir, 'OddsData.sqlite')
     duckdb_path = './nba-data/analytics.duckdb'
+    parquet_path = './data/odds_historical.parquet'
     
     print('=' * 65)
     print('Importing NBA Odds from GitHub (kyleskom)')
@@ -97,81 +171,56 @@ def import_data():
     
     # Connect to SQLite
     sqlite_conn = sqlite3.connect(db_path)
-    sqlite_cursor = sqlite_conn.cursor()
     
     total_imported = 0
     
-    # Import each season
-    for table in tables:
+    # All seasons in one UNION ALL; if any table breaks it, retry table by table and skip the bad ones
+    odds_df = pd.DataFrame()
+    if tables:
         try:
-            # Query data from SQLite
-            sqlite_cursor.execute(f'SELECT * FROM "{table["name"]}"')
-            rows = sqlite_cursor.fetchall()
-            
-            # Get column names
-            columns = [description[0] for description in sqlite_cursor.description]
-            
-            # Map columns to our schema
-            col_map = {col.lower().replace(' ', '_'): col for col in columns}
-            
-            # Prepare data for insertion
-            data_to_insert = []
-            for row in rows:
-                row_dict = dict(zip(columns, row))
-                
-                # Extract values with defaults
-                date_val = parse_date(row_dict.get('Date', ''))
-                home_team = row_dict.get('Home', '')
-                away_team = row_dict.get('Away', '')
-                ou = float(row_dict.get('OU', 0) or 0)
-                spread = float(row_dict.get('Spread', 0) or 0)
-                ml_home = str(row_dict.get('ML_Home', ''))
-                ml_away = str(row_dict.get('ML_Away', ''))
-                points = int(row_dict.get('Points', 0) or 0)
-                win_margin = int(row_dict.get('Win_Margin', 0) or 0)
-                days_rest_home = int(row_dict.get('Days_Rest_Home', 0) or 0)
-                days_rest_away = int(row_dict.get('Days_Rest_Away', 0) or 0)
-                
-                data_to_insert.append((
-                    table['season'],
-                    date_val,
-                    home_team,
-                    away_team,
-                    ou,
-                    spread,
-                    ml_home,
-                    ml_away,
-                    points,
-                    win_margin,
-                    days_rest_home,
-                    days_rest_away,
-                    'kyleskom'
-                ))
-            
-            # Insert into DuckDB
-            if data_to_insert:
-                conn.executemany('''
-                    INSERT INTO odds_historical 
-                    (season, date, home_team, away_team, over_under, spread, ml_home, ml_away, 
-                     total_points, win_margin, days_rest_home, days_rest_away, source)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', data_to_insert)
-                
-                total_imported += len(data_to_insert)
-                print(f'  {table["season"]}-{table["season"]+1}: {len(data_to_insert)} games')
-                
+            odds_df = read_odds(sqlite_conn, *build_union_query(sqlite_conn, tables))
         except Exception as e:
-            print(f'  Warning: Failed to import {table["name"]}: {e}')
+            print(f'  Warning: Combined read failed ({e}), importing season tables one by one')
+            season_dfs = []
+            for table in tables:
+                try:
+                    season_dfs.append(read_odds(sqlite_conn, *build_table_query(sqlite_conn, table)))
+                except Exception as e:
+                    print(f'  Warning: Failed to import {table["name"]}: {e}')
+            if season_dfs:
+                odds_df = pd.concat(season_dfs, ignore_index=True)
+    
+    # Insert into DuckDB (memory capped explicitly for the bulk insert)
+    if len(odds_df) > 0:
+        conn.execute(f"PRAGMA memory_limit='{IMPORT_MEMORY_LIMIT}'")
+        conn.register('odds_tmp', odds_df)
+        conn.execute('''
+            INSERT INTO odds_historical 
+            (season, date, home_team, away_team, over_under, spread, ml_home, ml_away, 
+             total_points, win_margin, days_rest_home, days_rest_away, source)
+            SELECT season, date, home_team, away_team, over_under, spread, ml_home, ml_away, 
+                   total_points, win_margin, days_rest_home, days_rest_away, source
+            FROM odds_tmp
+        ''')
+        conn.unregister('odds_tmp')
+        
+        total_imported = len(odds_df)
+        for season, games in odds_df.groupby('season').size().items():
+            print(f'  {season}-{season+1}: {games} games')
     
     sqlite_conn.close()
     
-    # Create indexes
-    print()
-    print('Creating indexes...')
-    conn.execute('CREATE INDEX idx_odds_date ON odds_historical(date)')
-    conn.execute('CREATE INDEX idx_odds_season ON odds_historical(season)')
-    conn.execute('CREATE INDEX idx_odds_home ON odds_historical(home_team)')
-    conn.execute('CREATE INDEX idx_odds_away ON odds_historical(away_team)')
+    # Parquet snapshot for downstream readers (season filters prune row groups)
+    if total_imported > 0:
+        print(f'Writing snapshot to {parquet_path}...')
+        conn.execute(f'''
+            COPY (SELECT * FROM odds_historical ORDER BY season, date)
+            TO '{parquet_path}' (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 100000)
+        ''')
+    
+    # No secondary indexes: DuckDB keeps min/max zonemaps per row group, and rows land
+    # in season/date order, so date and season filters already skip most of the table.
+    # Team lookups go through LOWER(TRIM(...)), which an ART index can't serve.
     
     # Print summary
     print()
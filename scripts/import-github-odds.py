@@ -6,11 +6,14 @@ Source: kyleskom/NBA-Machine-Learning-Sports-Betting
 
 import sqlite3
 import os
+import re
 import sys
 
 # Add project root to path for duckdb
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+ODDS_TABLE_RE = re.compile(r'odds_(\d{4})-\d{2}')
+
 def get_season_tables(db_path):
     """Get list of odds tables from the database"""
     conn = sqlite3.connect(db_path)
@@ -22,8 +25,7 @@ def get_season_tables(db_path):
     season_tables = []
     for (table_name,) in tables:
         # Extract season from table name (e.g., "odds_2010-11" -> 2010)
-        import re
-        match = re.match(r'odds_(\d{4})-\d{2}', table_name)
+        match = ODDS_TABLE_RE.match(table_name)
         if match:
             season = int(match.group(1))
             if season >= 2010:
@@ -0,0 +1,72 @@
+"""
+Model loading helpers shared by the prediction scripts
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.pipeline import Pipeline
+
+# ONNX export/runtime is optional: the joblib model is always saved and used as fallback
+try:
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+except ImportError:
+    ort = None
+
+def fold_scaler_into_trees(model, scaler):
+    """Rewrite tree split thresholds in raw feature units so the model takes unscaled input"""
+    # (x - mean) / scale <= t  <=>  x <= t * scale + mean, as StandardScaler scales are positive
+    for estimator in np.ravel(model.estimators_):
+        tree = estimator.tree_
+        split = tree.feature >= 0
+        features = tree.feature[split]
+        tree.threshold[split] = tree.threshold[split] * scaler.scale_[features] + scaler.mean_[features]
+    return model
+
+@lru_cache(maxsize=4)
+def load_folded_model(model_path, scaler_path):
+    """Load a tree model with its scaler folded in, once per process"""
+    model = joblib.load(model_path, mmap_mode='r')
+    
+    # Histogram GBM models are trained on raw features and saved without a scaler
+    if not os.path.exists(scaler_path):
+        return model
+    scaler = joblib.load(scaler_path, mmap_mode='r')
+    return fold_scaler_into_trees(model, scaler)
+
+def export_onnx(model, scaler, model_path):
+    """Save [scaler +] model as one ONNX graph next to the joblib model; returns the path or None"""
+    if ort is None:
+        return None
+    
+    # Same graph and path the prediction service builds, so it reuses this file
+    estimator = model if scaler is None else Pipeline([('scaler', scaler), ('model', model)])
+    onx = convert_sklearn(
+        estimator,
+        initial_types=[('X', FloatTensorType([None, model.n_features_in_]))],
+        options={id(model): {'zipmap': False}}
+    )
+    onnx_path = Path(model_path).with_suffix('.onnx')
+    tmp_path = onnx_path.with_name(f'{onnx_path.name}.{os.getpid()}.tmp')
+    tmp_path.write_bytes(onx.SerializeToString())
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+def load_onnx_session(model_path, scaler_path):
+    """Open the ONNX export of a model if it exists and is newer than the joblib files"""
+    onnx_path = Path(model_path).with_suffix('.onnx')
+    if ort is None or not onnx_path.exists():
+        return None
+    onnx_mtime = onnx_path.stat().st_mtime
+    source_paths = [p for p in (model_path, scaler_path) if os.path.exists(p)]
+    if any(onnx_mtime < os.path.getmtime(p) for p in source_paths):
+        return None
+    
+    sess_options = ort.SessionOptions()
+    sess_options.intra_op_num_threads = 1
+    return ort.InferenceSession(str(onnx_path), sess_options, providers=['CPUExecutionProvider'])
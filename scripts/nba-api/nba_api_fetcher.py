@@ -5,10 +5,17 @@ Wraps nba_api library to fetch tracking data from stats.nba.com
 Called from Node.js via Python shell
 """
 
+import os
 import sys
 import json
 import time
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from nba_api.stats.endpoints import (
     boxscoretraditionalv2,
     boxscoreplayertrackv2,
@@ -18,26 +25,71 @@ from nba_api.stats.endpoints import (
     boxscoreadvancedv2,
     boxscorematchups,
 )
+from nba_api.stats.library.http import NBAStatsHTTP
 from nba_api.stats.library.parameters import LeagueID
 
 
 class NBAAPIScraper:
     """Fetches detailed NBA data from official NBA Stats API"""
     
-    def __init__(self, rate_limit=0.6):
+    def __init__(self, rate_limit=0.6, pool_size=16, cache_dir=None):
         """
         Initialize scraper with rate limiting
-        rate_limit: seconds between requests (default 0.6 = 10 req/min)
+        rate_limit: seconds between request starts, shared by all threads
+        pool_size: keep-alive connections kept open to stats.nba.com
+        cache_dir: directory for finished-game endpoint responses (None disables caching)
         """
         self.rate_limit = rate_limit
-        self.last_request_time = 0
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.final_games = set()
+        self.next_request_time = 0
+        self._rate_lock = threading.Lock()
+        self._configure_session(pool_size)
+    
+    def _configure_session(self, pool_size):
+        """Share one pooled keep-alive session (with retries) across all endpoints"""
+        # Older nba_api releases open a new connection per request and have no session hook
+        if not hasattr(NBAStatsHTTP, 'set_session'):
+            return
+        
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504]
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        NBAStatsHTTP.set_session(session)
     
     def _apply_rate_limit(self):
-        """Apply rate limiting between requests"""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.rate_limit:
-            time.sleep(self.rate_limit - elapsed)
-        self.last_request_time = time.time()
+        """Reserve the next global request slot and wait for it"""
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self.next_request_time)
+            self.next_request_time = slot + self.rate_limit
+        
+        if slot > now:
+            time.sleep(slot - now)
+    
+    def _fetch_endpoint(self, key, game_id, build, cacheable):
+        """Fetch one endpoint, reusing the cached response for finished games fetched before"""
+        # Only finished games are ever written, so any cached response is safe to reuse
+        cache_path = self.cache_dir / key / f'{game_id}.json' if self.cache_dir else None
+        if cache_path is not None and cache_path.exists():
+            return json.loads(cache_path.read_text())
+        
+        self._apply_rate_limit()
+        result = build().get_normalized_dict()
+        
+        # Only finished games with data are stored: live, upcoming or empty responses would go stale.
+        # Write atomically so parallel runs never see partial files
+        if cache_path is not None and cacheable and any(result.values()):
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            tmp_path.write_text(json.dumps(result))
+            os.replace(tmp_path, cache_path)
+        return result
     
     def fetch_game(self, game_id: str) -> dict:
         """
@@ -63,86 +115,58 @@ class NBAAPIScraper:
         
         print(f"Fetching game {game_id}...", file=sys.stderr)
         
-        # 1. Box Score Traditional (basic stats)
-        try:
-            self._apply_rate_limit()
-            box = boxscoretraditionalv2.BoxScoreTraditionalV2(game_id=game_id)
-            data['boxscore_traditional'] = box.get_normalized_dict()
-            print(f"  ✓ Box score traditional", file=sys.stderr)
-        except Exception as e:
-            error_msg = f"Box score traditional failed: {str(e)}"
-            data['errors'].append(error_msg)
-            print(f"  ✗ {error_msg}", file=sys.stderr)
-        
-        # 2. Box Score Advanced
-        try:
-            self._apply_rate_limit()
-            advanced = boxscoreadvancedv2.BoxScoreAdvancedV2(game_id=game_id)
-            data['boxscore_advanced'] = advanced.get_normalized_dict()
-            print(f"  ✓ Box score advanced", file=sys.stderr)
-        except Exception as e:
-            error_msg = f"Box score advanced failed: {str(e)}"
-            data['errors'].append(error_msg)
-            print(f"  ✗ {error_msg}", file=sys.stderr)
-        
-        # 3. Player Tracking (speed, distance, touches)
-        try:
-            self._apply_rate_limit()
-            tracking = boxscoreplayertrackv2.BoxScorePlayerTrackV2(game_id=game_id)
-            data['player_tracking'] = tracking.get_normalized_dict()
-            print(f"  ✓ Player tracking", file=sys.stderr)
-        except Exception as e:
-            error_msg = f"Player tracking failed: {str(e)}"
-            data['errors'].append(error_msg)
-            print(f"  ✗ {error_msg}", file=sys.stderr)
-        
-        # 4. Shot Charts (coordinates)
-        try:
-            self._apply_rate_limit()
+        # (key, label, endpoint, optional) - optional endpoints are missing for older games
+        endpoints = [
+            ('boxscore_traditional', 'Box score traditional',
+             lambda: boxscoretraditionalv2.BoxScoreTraditionalV2(game_id=game_id), False),
+            ('boxscore_advanced', 'Box score advanced',
+             lambda: boxscoreadvancedv2.BoxScoreAdvancedV2(game_id=game_id), False),
+            ('player_tracking', 'Player tracking',
+             lambda: boxscoreplayertrackv2.BoxScorePlayerTrackV2(game_id=game_id), False),
             # Need team_id and player_id, but we can use 0 for all
-            shots = shotchartdetail.ShotChartDetail(
-                team_id=0,
-                player_id=0,
-                game_id_nullable=game_id,
-                context_measure_simple='FGA'
-            )
-            data['shot_charts'] = shots.get_normalized_dict()
-            print(f"  ✓ Shot charts ({len(data['shot_charts'].get('Shot_Chart_Detail', []))} shots)", file=sys.stderr)
-        except Exception as e:
-            error_msg = f"Shot charts failed: {str(e)}"
-            data['errors'].append(error_msg)
-            print(f"  ✗ {error_msg}", file=sys.stderr)
-        
-        # 5. Play-by-Play
-        try:
-            self._apply_rate_limit()
-            pbp = playbyplayv2.PlayByPlayV2(game_id=game_id)
-            data['play_by_play'] = pbp.get_normalized_dict()
-            print(f"  ✓ Play-by-play ({len(data['play_by_play'].get('PlayByPlay', []))} events)", file=sys.stderr)
-        except Exception as e:
-            error_msg = f"Play-by-play failed: {str(e)}"
-            data['errors'].append(error_msg)
-            print(f"  ✗ {error_msg}", file=sys.stderr)
-        
-        # 6. Hustle Stats (loose balls, deflections - not available for all games)
-        try:
-            self._apply_rate_limit()
-            hustle = hustlestatsboxscore.HustleStatsBoxScore(game_id=game_id)
-            data['hustle_stats'] = hustle.get_normalized_dict()
-            print(f"  ✓ Hustle stats", file=sys.stderr)
-        except Exception as e:
-            # Hustle stats not available for older games, don't treat as error
-            print(f"  ⚠ Hustle stats not available (normal for older games)", file=sys.stderr)
-        
-        # 7. Matchups (defensive matchups)
-        try:
-            self._apply_rate_limit()
-            matchups = boxscorematchups.BoxScoreMatchups(game_id=game_id)
-            data['matchups'] = matchups.get_normalized_dict()
-            print(f"  ✓ Matchups", file=sys.stderr)
-        except Exception as e:
-            # Matchups not available for older games
-            print(f"  ⚠ Matchups not available (normal for older games)", file=sys.stderr)
+            ('shot_charts', 'Shot charts',
+             lambda: shotchartdetail.ShotChartDetail(
+                 team_id=0,
+                 player_id=0,
+                 game_id_nullable=game_id,
+                 context_measure_simple='FGA'
+             ), False),
+            ('play_by_play', 'Play-by-play',
+             lambda: playbyplayv2.PlayByPlayV2(game_id=game_id), False),
+            ('hustle_stats', 'Hustle stats',
+             lambda: hustlestatsboxscore.HustleStatsBoxScore(game_id=game_id), True),
+            ('matchups', 'Matchups',
+             lambda: boxscorematchups.BoxScoreMatchups(game_id=game_id), True),
+        ]
+        
+        # Responses are cached only for games fetch_season_games saw as final
+        cacheable = game_id in self.final_games
+        
+        # Endpoints are independent: fetch them concurrently under the shared rate limit
+        with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+            futures = [
+                executor.submit(self._fetch_endpoint, key, game_id, build, cacheable)
+                for key, _, build, _ in endpoints
+            ]
+        
+        # Report in endpoint order
+        for (key, label, _, optional), future in zip(endpoints, futures):
+            try:
+                data[key] = future.result()
+            except Exception as e:
+                if optional:
+                    print(f"  ⚠ {label} not available (normal for older games)", file=sys.stderr)
+                else:
+                    error_msg = f"{label} failed: {str(e)}"
+                    data['errors'].append(error_msg)
+                    print(f"  ✗ {error_msg}", file=sys.stderr)
+                continue
+            
+            if key == 'shot_charts':
+                label = f"{label} ({len(data[key].get('Shot_Chart_Detail', []))} shots)"
+            elif key == 'play_by_play':
+                label = f"{label} ({len(data[key].get('PlayByPlay', []))} events)"
+            print(f"  ✓ {label}", file=sys.stderr)
         
         return data
     
@@ -168,7 +192,12 @@ class NBAAPIScraper:
         )
         
         games = game_finder.get_normalized_dict()
-        game_ids = list(set([game['GAME_ID'] for game in games.get('LeagueGameFinderResults', [])]))
+        rows = games.get('LeagueGameFinderResults', [])
+        game_ids = list(set([game['GAME_ID'] for game in rows]))
+        
+        # A game is final once every team row has a result (WL is empty while it is in progress)
+        unfinished = {game['GAME_ID'] for game in rows if not game.get('WL')}
+        self.final_games.update(set(game_ids) - unfinished)
         
         return game_ids
 
@@ -178,10 +207,18 @@ def main():
     parser.add_argument('--game-id', help='Fetch single game by ID')
     parser.add_argument('--season', help='Fetch all games for season (e.g., 2023-24)')
     parser.add_argument('--rate-limit', type=float, default=0.6, help='Rate limit in seconds')
+    parser.add_argument('--workers', type=int, default=8, help='Games fetched concurrently (--season)')
+    parser.add_argument('--cache-dir', default='.cache/nba_api', help='Cache for completed-game responses (written by --season runs)')
+    parser.add_argument('--no-cache', action='store_true', help='Always refetch from stats.nba.com')
     
     args = parser.parse_args()
     
-    scraper = NBAAPIScraper(rate_limit=args.rate_limit)
+    # One pooled connection per in-flight endpoint call
+    scraper = NBAAPIScraper(
+        rate_limit=args.rate_limit,
+        pool_size=max(16, args.workers * 7),
+        cache_dir=None if args.no_cache else args.cache_dir
+    )
     
     if args.game_id:
         # Fetch single game
@@ -194,11 +231,14 @@ def main():
         game_ids = scraper.fetch_season_games(args.season)
         print(f"Found {len(game_ids)} games", file=sys.stderr)
         
-        all_games = []
-        for i, game_id in enumerate(game_ids):
+        def fetch_numbered(numbered):
+            i, game_id = numbered
             print(f"\n[{i+1}/{len(game_ids)}] Game {game_id}", file=sys.stderr)
-            game_data = scraper.fetch_game(game_id)
-            all_games.append(game_data)
+            return scraper.fetch_game(game_id)
+        
+        # Games overlap too; total request rate is still capped by the shared limiter
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            all_games = list(executor.map(fetch_numbered, enumerate(game_ids)))
         
         print(json.dumps(all_games, indent=2))
     
@@ -0,0 +1,59 @@
+"""
+Shared DuckDB queries for the prediction scripts
+"""
+
+import hashlib
+import os
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+# Daily Parquet snapshots of the upcoming-games pivot
+UPCOMING_CACHE_DIR = Path('./.cache/upcoming')
+
+# Upcoming games from The Odds API: one row per game with all markets, missing odds defaulted
+UPCOMING_GAMES_SQL = '''
+    SELECT 
+        game_id,
+        home_team,
+        away_team,
+        commence_time,
+        COALESCE(MAX(CASE WHEN market = 'spreads' THEN close_line END), 0) as spread_num,
+        COALESCE(MAX(CASE WHEN market = 'totals' THEN close_line END), 220) as over_under,
+        COALESCE(MAX(CASE WHEN market = 'h2h' THEN home_implied_prob END), 0.5) as ml_home_prob,
+        COALESCE(MAX(CASE WHEN market = 'h2h' THEN away_implied_prob END), 0.5) as ml_away_prob
+    FROM odds_api_2025
+    WHERE commence_time >= CURRENT_DATE
+    GROUP BY game_id, home_team, away_team, commence_time
+    ORDER BY commence_time
+'''
+
+def upcoming_cache_path(conn):
+    """Snapshot path for today, keyed on the current state of odds_api_2025"""
+    # Row count + last fetch change whenever odds are re-fetched, so stale snapshots are never hit
+    odds_state = conn.execute('SELECT COUNT(*), MAX(fetched_at) FROM odds_api_2025').fetchone()
+    odds_key = hashlib.md5(repr(odds_state).encode()).hexdigest()[:12]
+    return UPCOMING_CACHE_DIR / f'upcoming_{date.today():%Y%m%d}_{odds_key}.parquet'
+
+def upcoming_games_df(conn):
+    """Fetch upcoming games as an Arrow-backed DataFrame, reusing today's snapshot when odds are unchanged"""
+    cache_path = upcoming_cache_path(conn)
+    
+    if cache_path.exists():
+        return conn.execute(f'''
+            SELECT * FROM read_parquet('{cache_path.as_posix()}')
+            WHERE commence_time >= CURRENT_DATE
+        ''').arrow().read_pandas(types_mapper=pd.ArrowDtype)
+    
+    games = conn.execute(UPCOMING_GAMES_SQL).arrow().read_pandas(types_mapper=pd.ArrowDtype)
+    
+    # Replace older snapshots with this one (atomic rename)
+    UPCOMING_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for old_path in UPCOMING_CACHE_DIR.glob('upcoming_*.parquet'):
+        old_path.unlink(missing_ok=True)
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    games.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    
+    return games
@@ -7,17 +7,19 @@ Uses model trained with and without odds
 import duckdb
 import pandas as pd
 import numpy as np
-import joblib
 import os
 from glob import glob
 from datetime import datetime
 
+from model_utils import load_folded_model, load_onnx_session
+
 class NBAPredictorV2:
     def __init__(self):
         self.db_path = './nba-data/analytics.duckdb'
         self.models_dir = './models'
         self.model = None
-        self.scaler = None
+        self.conn = None
+        self.session = None
         self.features = ['elo_diff', 'home_last10_wins', 'away_last10_wins', 
                         'spread_num', 'over_under', 'ml_home_prob', 
                         'ml_away_prob', 'rest_days_home', 'rest_days_away', 'has_odds']
@@ -27,72 +29,62 @@ class NBAPredictorV2:
         print('Loading model V2...')
         
         model_files = glob(f'{self.models_dir}/nba_model_v2_*.joblib')
-        scaler_files = glob(f'{self.models_dir}/scaler_v2_*.joblib')
         
-        if not model_files or not scaler_files:
+        if not model_files:
             raise FileNotFoundError('No V2 model found. Run train-ml-model-v2.py first.')
         
-        latest_model = sorted(model_files)[-1]
-        latest_scaler = sorted(scaler_files)[-1]
+        # Models trained before the scaler was dropped have one saved alongside
+        latest_model = max(model_files, key=os.path.getmtime)
+        latest_scaler = latest_model.replace('nba_model_', 'scaler_')
         
-        self.model = joblib.load(latest_model)
-        self.scaler = joblib.load(latest_scaler)
+        # ONNX export when the trainer wrote one, else the joblib model
+        self.session = load_onnx_session(latest_model, latest_scaler)
+        if self.session is None:
+            # Scaler is folded into the tree thresholds, so predict takes raw features
+            self.model = load_folded_model(latest_model, latest_scaler)
         
-        print(f'Loaded: {os.path.basename(latest_model)}')
-        print(f'Scaler: {os.path.basename(latest_scaler)}')
+        print(f'Loaded: {os.path.basename(latest_model)}' + (' (ONNX)' if self.session is not None else ''))
+        if os.path.exists(latest_scaler):
+            print(f'Scaler: {os.path.basename(latest_scaler)}')
         
     def get_upcoming_games(self):
-        """Get upcoming games from The Odds API"""
+        """Get upcoming games from The Odds API, joined with latest ELO"""
         print('\nFetching upcoming games...')
-        conn = duckdb.connect(self.db_path)
-        
-        games = conn.execute('''
+        # Odds pivot and ELO lookup (end of 2024 season) in one query
+        games = self.conn.execute('''
+            WITH elo AS (
+                SELECT 
+                    home_team AS team,
+                    AVG(elo_home_after) as avg_elo
+                FROM github_games
+                WHERE season = 2024
+                GROUP BY home_team
+            )
             SELECT 
-                game_id,
-                home_team,
-                away_team,
-                commence_time,
-                MAX(CASE WHEN market = 'spreads' THEN close_line END) as spread,
-                MAX(CASE WHEN market = 'totals' THEN close_line END) as over_under,
-                MAX(CASE WHEN market = 'h2h' THEN home_implied_prob END) as ml_home_prob,
-                MAX(CASE WHEN market = 'h2h' THEN away_implied_prob END) as ml_away_prob
-            FROM odds_api_2025
-            WHERE commence_time >= CURRENT_DATE
-            GROUP BY game_id, home_team, away_team, commence_time
-            ORDER BY commence_time
+                o.game_id,
+                o.home_team,
+                o.away_team,
+                o.commence_time,
+                MAX(CASE WHEN o.market = 'spreads' THEN o.close_line END) as spread,
+                MAX(CASE WHEN o.market = 'totals' THEN o.close_line END) as over_under,
+                MAX(CASE WHEN o.market = 'h2h' THEN o.home_implied_prob END) as ml_home_prob,
+                MAX(CASE WHEN o.market = 'h2h' THEN o.away_implied_prob END) as ml_away_prob,
+                COALESCE(eh.avg_elo, 1500) as elo_home,
+                COALESCE(ea.avg_elo, 1500) as elo_away,
+                COALESCE(eh.avg_elo, 1500) - COALESCE(ea.avg_elo, 1500) as elo_diff
+            FROM odds_api_2025 o
+            LEFT JOIN elo eh ON eh.team = o.home_team
+            LEFT JOIN elo ea ON ea.team = o.away_team
+            WHERE o.commence_time >= CURRENT_DATE
+            GROUP BY ALL
+            ORDER BY o.commence_time
         ''').fetchdf()
         
-        conn.close()
-        
         print(f'Found {len(games)} upcoming games')
         return games
     
     def prepare_features(self, games_df):
-        """Prepare features with ELO from latest available"""
-        conn = duckdb.connect(self.db_path)
-        
-        # Get latest ELO for each team (from end of 2024 season)
-        print('\nFetching latest ELO ratings...')
-        elo_data = conn.execute('''
-            SELECT 
-                home_team,
-                AVG(elo_home_after) as avg_elo
-            FROM github_games
-            WHERE season = 2024
-            GROUP BY home_team
-        ''').fetchdf()
-        
-        conn.close()
-        
-        # Create ELO lookup
-        elo_dict = dict(zip(elo_data['home_team'], elo_data['avg_elo']))
-        default_elo = 1500
-        
-        # Add ELO features
-        games_df['elo_home'] = games_df['home_team'].map(lambda x: elo_dict.get(x, default_elo))
-        games_df['elo_away'] = games_df['away_team'].map(lambda x: elo_dict.get(x, default_elo))
-        games_df['elo_diff'] = games_df['elo_home'] - games_df['elo_away']
-        
+        """Prepare features (ELO already joined by get_upcoming_games)"""
         # Form features (neutral for upcoming games)
         games_df['home_last10_wins'] = 0.5
         games_df['away_last10_wins'] = 0.5
@@ -108,9 +100,9 @@ class NBAPredictorV2:
         games_df['rest_days_away'] = 2
         
         # Flag for odds availability
-        games_df['has_odds'] = games_df['spread'].notna().astype(int)
+        games_df['has_odds'] = games_df['spread'].notna().astype(np.int8)
         
-        return games_df[self.features]
+        return games_df.loc[:, self.features].to_numpy(dtype=np.float32)
     
     def predict(self):
         """Main prediction"""
@@ -119,56 +111,67 @@ class NBAPredictorV2:
         print('='*70)
         
         self.load_model()
-        games_df = self.get_upcoming_games()
-        
-        if len(games_df) == 0:
-            print('No upcoming games found.')
-            return
-        
-        # Prepare features
-        X = self.prepare_features(games_df)
-        X_scaled = self.scaler.transform(X)
-        
-        # Predict
-        predictions = self.model.predict(X_scaled)
-        probabilities = self.model.predict_proba(X_scaled)
-        
-        # Add to dataframe
-        games_df['predicted_winner'] = np.where(predictions == 1, 
-                                               games_df['home_team'], 
-                                               games_df['away_team'])
-        games_df['home_win_prob'] = probabilities[:, 1]
-        games_df['away_win_prob'] = probabilities[:, 0]
-        games_df['confidence'] = np.abs(probabilities[:, 1] - 0.5) * 2
-        
-        # Display
-        print('\n' + '-'*70)
-        print(f'{'Date':<12} {'Match':<45} {'Prediction':<25} {'Conf.':<8}')
-        print('-'*70)
-        
-        for _, row in games_df.iterrows():
-            match_str = f"{row['away_team']} @ {row['home_team']}"
-            conf_str = f"{row['confidence']:.1%}"
-            date_str = str(row['commence_time'])[:10]
-            
-            print(f"{date_str:<12} {match_str:<45} {row['predicted_winner']:<25} {conf_str:<8}")
-        
-        print('-'*70)
-        print(f"\nTotal: {len(games_df)} predictions")
-        print(f"High confidence (>60%): {(games_df['confidence'] > 0.6).sum()}")
-        print(f"Very high (>70%): {(games_df['confidence'] > 0.7).sum()}")
-        print(f"Excellent (>80%): {(games_df['confidence'] > 0.8).sum()}")
         
-        # Save
-        self.save_predictions(games_df)
-        
-        print('\n' + '='*70)
+        # One connection for the whole run, shared by the helpers
+        self.conn = duckdb.connect(self.db_path)
+        try:
+            games_df = self.get_upcoming_games()
+            
+            if len(games_df) == 0:
+                print('No upcoming games found.')
+                return
+            
+            # Prepare features
+            X = self.prepare_features(games_df)
+            
+            # Predict all upcoming games in one pass; labels come from the probabilities
+            if self.session is not None:
+                predictions, probabilities = self.session.run(None, {'X': X})
+            else:
+                probabilities = self.model.predict_proba(X)
+                predictions = self.model.classes_[probabilities.argmax(axis=1)]
+            
+            # Add to dataframe
+            games_df['predicted_winner'] = np.where(predictions == 1, 
+                                                   games_df['home_team'], 
+                                                   games_df['away_team'])
+            games_df['home_win_prob'] = probabilities[:, 1]
+            games_df['away_win_prob'] = probabilities[:, 0]
+            games_df['confidence'] = np.abs(probabilities[:, 1] - 0.5) * 2
+            
+            # Display
+            print('\n' + '-'*70)
+            print(f'{'Date':<12} {'Match':<45} {'Prediction':<25} {'Conf.':<8}')
+            print('-'*70)
+            
+            dates = games_df['commence_time'].astype(str).str[:10]
+            matches = games_df['away_team'] + ' @ ' + games_df['home_team']
+            print('\n'.join(
+                f"{date_str:<12} {match_str:<45} {winner:<25} {conf:<8.1%}"
+                for date_str, match_str, winner, conf
+                in zip(dates, matches, games_df['predicted_winner'], games_df['confidence'])
+            ))
+            
+            # Games above each confidence threshold, from one sorted array
+            conf_sorted = np.sort(games_df['confidence'].to_numpy())
+            above_60, above_70, above_80 = len(conf_sorted) - np.searchsorted(conf_sorted, [0.6, 0.7, 0.8], side='right')
+            
+            print('-'*70)
+            print(f"\nTotal: {len(games_df)} predictions")
+            print(f"High confidence (>60%): {above_60}")
+            print(f"Very high (>70%): {above_70}")
+            print(f"Excellent (>80%): {above_80}")
+            
+            # Save
+            self.save_predictions(games_df)
+            
+            print('\n' + '='*70)
+        finally:
+            self.conn.close()
     
     def save_predictions(self, predictions_df):
         """Save predictions"""
-        conn = duckdb.connect(self.db_path)
-        
-        conn.execute('''
+        self.conn.execute('''
             CREATE TABLE IF NOT EXISTS predictions_v2 (
                 game_id VARCHAR,
                 date TIMESTAMP,
@@ -182,23 +185,21 @@ class NBAPredictorV2:
             )
         ''')
         
-        for _, row in predictions_df.iterrows():
-            conn.execute(f"""
-                INSERT INTO predictions_v2 
-                VALUES (
-                    '{row['game_id']}',
-                    '{row['commence_time']}',
-                    '{row['home_team'].replace("'", "''")}',
-                    '{row['away_team'].replace("'", "''")}',
-                    '{row['predicted_winner'].replace("'", "''")}',
-                    {row['home_win_prob']},
-                    {row['away_win_prob']},
-                    {row['confidence']}
-                )
-            """)
-        
-        conn.commit()
-        conn.close()
+        # One set-based insert; values bind as typed columns, no SQL quoting
+        out = predictions_df[[
+            'game_id', 'commence_time', 'home_team', 'away_team',
+            'predicted_winner', 'home_win_prob', 'away_win_prob', 'confidence'
+        ]].rename(columns={'commence_time': 'date'})
+        self.conn.register('preds_tmp', out)
+        self.conn.execute("""
+            INSERT INTO predictions_v2 
+            (game_id, date, home_team, away_team, predicted_winner, 
+             home_win_prob, away_win_prob, confidence)
+            SELECT * FROM preds_tmp
+        """)
+        self.conn.unregister('preds_tmp')
+        
+        self.conn.commit()
         print(f'\nPredictions saved.')
 
 if __name__ == '__main__':
@@ -5,11 +5,13 @@ Uses V3 models with season feature and exclusions
 """
 
 import duckdb
-import pandas as pd
 import numpy as np
-import joblib
 import os
 from glob import glob
+from threadpoolctl import threadpool_limits
+
+from model_utils import load_folded_model, load_onnx_session
+from nba_sql import upcoming_games_df
 
 class NBAPredictorV3:
     def __init__(self, model_type='2025'):
@@ -17,7 +19,8 @@ class NBAPredictorV3:
         self.models_dir = './models'
         self.model_type = model_type
         self.model = None
-        self.scaler = None
+        self.conn = None
+        self.session = None
         self.features = [
             'elo_diff', 'elo_diff_norm', 'home_last10_wins', 'away_last10_wins',
             'spread_num', 'over_under', 'ml_home_prob', 'ml_away_prob',
@@ -39,58 +42,41 @@ class NBAPredictorV3:
         if not model_files:
             raise FileNotFoundError('No V3 model found')
         
-        latest_model = sorted(model_files)[-1]
+        latest_model = max(model_files, key=os.path.getmtime)
         latest_scaler = latest_model.replace('nba_model_', 'scaler_')
         
-        self.model = joblib.load(latest_model)
-        self.scaler = joblib.load(latest_scaler)
+        # Prefer the ONNX export (scaler included); fall back to the joblib model
+        self.session = load_onnx_session(latest_model, latest_scaler)
+        if self.session is None:
+            # Scaler is folded into the tree thresholds, so predict takes raw features
+            self.model = load_folded_model(latest_model, latest_scaler)
+            if hasattr(self.model, 'n_jobs'):
+                self.model.n_jobs = 1
         
-        print(f'Loaded: {os.path.basename(latest_model)}')
+        print(f'Loaded: {os.path.basename(latest_model)}' + (' (ONNX)' if self.session is not None else ''))
         
     def get_upcoming_games(self):
         """Get upcoming games"""
         print('\nFetching upcoming games...')
-        conn = duckdb.connect(self.db_path)
-        
-        games = conn.execute('''
-            SELECT 
-                game_id,
-                home_team,
-                away_team,
-                commence_time,
-                MAX(CASE WHEN market = 'spreads' THEN close_line END) as spread,
-                MAX(CASE WHEN market = 'totals' THEN close_line END) as over_under,
-                MAX(CASE WHEN market = 'h2h' THEN home_implied_prob END) as ml_home_prob,
-                MAX(CASE WHEN market = 'h2h' THEN away_implied_prob END) as ml_away_prob
-            FROM odds_api_2025
-            WHERE commence_time >= CURRENT_DATE
-            GROUP BY game_id, home_team, away_team, commence_time
-            ORDER BY commence_time
-        ''').fetchdf()
-        
-        conn.close()
+        games = upcoming_games_df(self.conn)
+        
         print(f'Found {len(games)} games')
         return games
     
     def prepare_features(self, games_df):
         """Prepare features"""
-        conn = duckdb.connect(self.db_path)
-        
         # Get latest ELO (2024)
         print('\nFetching latest ELO...')
-        elo_data = conn.execute('''
+        elo_dict = dict(self.conn.execute('''
             SELECT home_team, AVG(elo_home_after) as elo
             FROM github_games
             WHERE season = 2024
             GROUP BY home_team
-        ''').fetchdf()
-        conn.close()
-        
-        elo_dict = dict(zip(elo_data['home_team'], elo_data['elo']))
+        ''').fetchall())
         
         # Add ELO
-        games_df['elo_home'] = games_df['home_team'].map(lambda x: elo_dict.get(x, 1500))
-        games_df['elo_away'] = games_df['away_team'].map(lambda x: elo_dict.get(x, 1500))
+        games_df['elo_home'] = games_df['home_team'].map(elo_dict).fillna(1500)
+        games_df['elo_away'] = games_df['away_team'].map(elo_dict).fillna(1500)
         games_df['elo_diff'] = games_df['elo_home'] - games_df['elo_away']
         games_df['elo_diff_norm'] = (games_df['elo_diff'] + 400) / 800
         
@@ -98,11 +84,7 @@ class NBAPredictorV3:
         games_df['home_last10_wins'] = 0.5
         games_df['away_last10_wins'] = 0.5
         
-        # Odds
-        games_df['spread_num'] = pd.to_numeric(games_df['spread'], errors='coerce').fillna(0)
-        games_df['over_under'] = pd.to_numeric(games_df['over_under'], errors='coerce').fillna(220)
-        games_df['ml_home_prob'] = games_df['ml_home_prob'].fillna(0.5)
-        games_df['ml_away_prob'] = games_df['ml_away_prob'].fillna(0.5)
+        # Odds: already defaulted in get_upcoming_games
         
         # Rest
         games_df['rest_days_home'] = 2
@@ -113,7 +95,11 @@ class NBAPredictorV3:
         if self.model_type == '2025':
             games_df['season_norm'] = (2025 - 2019) / 4
         
-        return games_df[self.features]
+        # One contiguous float32 block, fed straight to the model
+        X = np.empty((len(games_df), len(self.features)), dtype=np.float32)
+        for i, col in enumerate(self.features):
+            X[:, i] = games_df[col].to_numpy(dtype=np.float32)
+        return X
     
     def predict(self):
         """Main prediction"""
@@ -122,39 +108,53 @@ class NBAPredictorV3:
         print('='*70)
         
         self.load_model()
-        games_df = self.get_upcoming_games()
-        
-        if len(games_df) == 0:
-            print('No games found')
-            return
-        
-        X = self.prepare_features(games_df)
-        X_scaled = self.scaler.transform(X)
-        
-        predictions = self.model.predict(X_scaled)
-        probabilities = self.model.predict_proba(X_scaled)
-        
-        games_df['predicted_winner'] = np.where(predictions == 1,
-                                               games_df['home_team'],
-                                               games_df['away_team'])
-        games_df['home_win_prob'] = probabilities[:, 1]
-        games_df['confidence'] = np.abs(probabilities[:, 1] - 0.5) * 2
-        
-        # Display
-        print('\n' + '-'*70)
-        print(f'{"Date":<12} {"Match":<45} {"Prediction":<25} {"Conf.":<8}')
-        print('-'*70)
-        
-        for _, row in games_df.iterrows():
-            match = f"{row['away_team']} @ {row['home_team']}"
-            print(f"{str(row['commence_time'])[:10]:<12} {match:<45} "
-                  f"{row['predicted_winner']:<25} {row['confidence']:.1%}")
-        
-        print('-'*70)
-        print(f"\nTotal: {len(games_df)}")
-        print(f">60%: {(games_df['confidence'] > 0.6).sum()}")
-        print(f">70%: {(games_df['confidence'] > 0.7).sum()}")
-        print(f">80%: {(games_df['confidence'] > 0.8).sum()}")
+        
+        # One connection for the whole run, shared by the helpers
+        self.conn = duckdb.connect(self.db_path)
+        try:
+            games_df = self.get_upcoming_games()
+            
+            if len(games_df) == 0:
+                print('No games found')
+                return
+            
+            X = self.prepare_features(games_df)
+            
+            if self.session is not None:
+                predictions, probabilities = self.session.run(None, {'X': X})
+            else:
+                # Few games per run; keep BLAS/OpenMP single-threaded
+                with threadpool_limits(limits=1):
+                    probabilities = self.model.predict_proba(X)
+                predictions = self.model.classes_[probabilities.argmax(axis=1)]
+            
+            games_df['predicted_winner'] = games_df['home_team'].where(predictions == 1, games_df['away_team'])
+            games_df['home_win_prob'] = probabilities[:, 1]
+            games_df['confidence'] = np.abs(probabilities[:, 1] - 0.5) * 2
+            
+            # Display
+            print('\n' + '-'*70)
+            print(f'{"Date":<12} {"Match":<45} {"Prediction":<25} {"Conf.":<8}')
+            print('-'*70)
+            
+            dates = games_df['commence_time'].astype(str).str[:10]
+            matches = games_df['away_team'] + ' @ ' + games_df['home_team']
+            print('\n'.join(
+                f"{date_str:<12} {match:<45} {winner:<25} {conf:.1%}"
+                for date_str, match, winner, conf
+                in zip(dates, matches, games_df['predicted_winner'], games_df['confidence'])
+            ))
+            
+            conf_sorted = np.sort(games_df['confidence'].to_numpy())
+            above_60, above_70, above_80 = len(conf_sorted) - np.searchsorted(conf_sorted, [0.6, 0.7, 0.8], side='right')
+            
+            print('-'*70)
+            print(f"\nTotal: {len(games_df)}")
+            print(f">60%: {above_60}")
+            print(f">70%: {above_70}")
+            print(f">80%: {above_80}")
+        finally:
+            self.conn.close()
 
 if __name__ == '__main__':
     # Use 2025 model by default
@@ -0,0 +1,52 @@
+"""
+Tests for model_utils: scaler folding must not change predictions
+"""
+
+import joblib
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, HistGradientBoostingClassifier
+from sklearn.preprocessing import StandardScaler
+
+from model_utils import load_folded_model
+
+def make_data(n_rows=2000, seed=42):
+    """Raw float32 features on game-like scales (ELO diff, spread, probabilities), plus labels"""
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.normal(0, 150, n_rows),
+        rng.normal(0, 7, n_rows),
+        rng.normal(220, 12, n_rows),
+        rng.uniform(0, 1, n_rows),
+    ]).astype(np.float32)
+    y = (X[:, 0] / 150 + X[:, 1] / 7 + rng.normal(0, 1, n_rows) > 0).astype(int)
+    return X, y
+
+def test_folded_model_matches_scaled_predictions(tmp_path):
+    X, y = make_data()
+    scaler = StandardScaler().fit(X)
+    model = GradientBoostingClassifier(n_estimators=50, max_depth=4, random_state=42)
+    model.fit(scaler.transform(X), y)
+    
+    model_path = tmp_path / 'nba_model_test.joblib'
+    scaler_path = tmp_path / 'scaler_test.joblib'
+    joblib.dump(model, model_path)
+    joblib.dump(scaler, scaler_path)
+    
+    folded = load_folded_model(str(model_path), str(scaler_path))
+    X_new, _ = make_data(n_rows=20000, seed=7)
+    
+    np.testing.assert_array_equal(
+        folded.predict_proba(X_new),
+        model.predict_proba(scaler.transform(X_new))
+    )
+
+def test_model_without_scaler_is_returned_unfolded(tmp_path):
+    X, y = make_data()
+    model = HistGradientBoostingClassifier(max_iter=50, random_state=42).fit(X, y)
+    
+    model_path = tmp_path / 'nba_model_test.joblib'
+    joblib.dump(model, model_path)
+    
+    loaded = load_folded_model(str(model_path), str(tmp_path / 'scaler_test.joblib'))
+    
+    np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
@@ -10,11 +10,37 @@ import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import GradientBoostingClassifier
 from sklearn.metrics import accuracy_score, classification_report, roc_auc_score
-from sklearn.preprocessing import StandardScaler
 import joblib
 import os
 from datetime import datetime
 
+from model_utils import export_onnx
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+if njit is not None:
+    # No fastmath: it lets LLVM assume no NaNs and drop the isnan check
+    @njit(parallel=True, cache=True)
+    def odds_to_prob(odds, out):
+        """Implied probability from American odds into out, 0.5 where missing"""
+        for i in prange(odds.shape[0]):
+            x = odds[i]
+            if np.isnan(x):
+                out[i] = 0.5
+            elif x > 0:
+                out[i] = 100.0 / (x + 100.0)
+            else:
+                out[i] = abs(x) / (abs(x) + 100.0)
+else:
+    def odds_to_prob(odds, out):
+        """Implied probability from American odds into out, 0.5 where missing"""
+        abs_odds = np.abs(odds)
+        np.divide(np.where(odds > 0, 100.0, abs_odds), abs_odds + 100.0, out=out)
+        out[np.isnan(odds)] = 0.5
+
 class NBAMLTrainerV2:
     def __init__(self):
         self.db_path = './nba-data/analytics.duckdb'
@@ -22,12 +48,13 @@ class NBAMLTrainerV2:
         os.makedirs(self.models_dir, exist_ok=True)
         
     def load_data(self):
-        """Load all data"""
+        """Load all games with ELO, joined with historical odds"""
         print('Loading data...')
         conn = duckdb.connect(self.db_path)
         
         # Load all games with ELO
-        games_query = """
+        conn.execute("""
+            CREATE TEMP VIEW games AS
             SELECT 
                 game_id,
                 date,
@@ -43,85 +70,77 @@ class NBAMLTrainerV2:
             FROM github_games
             WHERE elo_home_before IS NOT NULL
             ORDER BY date
-        """
+        """)
         
-        games_df = conn.execute(games_query).fetchdf()
-        print(f'Loaded {len(games_df)} games with ELO')
+        games_count = conn.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+        print(f'Loaded {games_count} games with ELO')
         
-        # Load odds - separate query to check availability
-        odds_query = """
-            SELECT 
-                season,
-                date,
-                home_team,
-                away_team,
-                spread,
-                over_under,
-                ml_home,
-                ml_away
-            FROM odds_historical
-        """
+        odds_count = conn.execute('SELECT COUNT(*) FROM odds_historical').fetchone()[0]
+        print(f'Loaded {odds_count} odds entries')
         
-        odds_df = conn.execute(odds_query).fetchdf()
-        print(f'Loaded {len(odds_df)} odds entries')
+        # Merge games with odds: abbreviations -> full names via team_mapping,
+        # odds names trimmed and lowercased. Games keep their date order.
+        print('Merging games with odds...')
+        merged = conn.execute("""
+            SELECT 
+                g.* EXCLUDE (game_row),
+                o.spread,
+                o.over_under,
+                o.ml_home,
+                o.ml_away
+            FROM (SELECT *, row_number() OVER () as game_row FROM games) g
+            LEFT JOIN team_mapping th ON upper(th.abbreviation) = g.home_team
+            LEFT JOIN team_mapping ta ON upper(ta.abbreviation) = g.away_team
+            LEFT JOIN (SELECT *, row_number() OVER () as odds_row FROM odds_historical) o
+                ON o.season = g.season
+                AND lower(trim(o.home_team)) = lower(th.full_name)
+                AND lower(trim(o.away_team)) = lower(ta.full_name)
+            ORDER BY g.game_row, o.odds_row
+        """).fetchdf()
         
         conn.close()
         
-        return games_df, odds_df
+        return merged
     
-    def engineer_features(self, games_df, odds_df):
+    def engineer_features(self, merged):
         """Create features with fallback for missing odds"""
         print('\nEngineering features...')
         
-        # Map team names
-        conn = duckdb.connect(self.db_path)
-        mapping_df = conn.execute('SELECT * FROM team_mapping').fetchdf()
-        conn.close()
-        
-        team_map = dict(zip(mapping_df['abbreviation'].str.upper(), 
-                           mapping_df['full_name'].str.lower()))
-        
-        # Map games team names
-        games_df['home_team_mapped'] = games_df['home_team'].map(team_map)
-        games_df['away_team_mapped'] = games_df['away_team'].map(team_map)
-        
-        # Normalize odds team names
-        odds_df['home_team_clean'] = odds_df['home_team'].str.strip().str.lower()
-        odds_df['away_team_clean'] = odds_df['away_team'].str.strip().str.lower()
-        
-        # Merge games with odds
-        print('Merging games with odds...')
-        merged = games_df.merge(
-            odds_df[['season', 'home_team_clean', 'away_team_clean', 'spread', 'over_under', 'ml_home', 'ml_away']],
-            left_on=['season', 'home_team_mapped', 'away_team_mapped'],
-            right_on=['season', 'home_team_clean', 'away_team_clean'],
-            how='left'
-        )
-        
         print(f'  Total games: {len(merged)}')
         print(f'  With odds: {merged["spread"].notna().sum()} ({merged["spread"].notna().sum()/len(merged)*100:.1f}%)')
         print(f'  Without odds: {merged["spread"].isna().sum()}')
         
-        # Check by season
+        # Check by season (one grouped pass: count skips missing odds, size counts games)
         print('\n  Odds availability by season:')
-        for season in sorted(merged['season'].unique()):
-            season_data = merged[merged['season'] == season]
-            with_odds = season_data['spread'].notna().sum()
-            total = len(season_data)
+        by_season = merged.groupby('season')['spread'].agg(['count', 'size'])
+        for season, with_odds, total in by_season.itertuples():
             print(f'    {season}: {with_odds}/{total} ({with_odds/total*100:.1f}%)')
         
         # Calculate rolling features
         print('\nCalculating rolling features...')
         merged = merged.sort_values('date')
         
-        # Form features (last 10 games)
-        merged['home_last10_wins'] = merged.groupby('home_team')['home_win'].transform(
-            lambda x: x.shift(1).rolling(window=10, min_periods=1).mean()
-        ).fillna(0.5)
-        
-        merged['away_last10_wins'] = merged.groupby('away_team')['home_win'].transform(
-            lambda x: (1 - x).shift(1).rolling(window=10, min_periods=1).mean()
-        ).fillna(0.5)
+        # Form features (last 10 games), one window pass in DuckDB.
+        # Windows follow the date-sorted row order, matching the previous groupby/rolling.
+        form_conn = duckdb.connect()
+        form_conn.register('form_tmp', merged[['home_team', 'away_team', 'home_win']].assign(row_idx=np.arange(len(merged))))
+        form = form_conn.execute('''
+            SELECT 
+                AVG(home_win) OVER (
+                    PARTITION BY home_team ORDER BY row_idx
+                    ROWS BETWEEN 10 PRECEDING AND 1 PRECEDING
+                ) as home_last10_wins,
+                AVG(1 - home_win) OVER (
+                    PARTITION BY away_team ORDER BY row_idx
+                    ROWS BETWEEN 10 PRECEDING AND 1 PRECEDING
+                ) as away_last10_wins
+            FROM form_tmp
+            ORDER BY row_idx
+        ''').fetchdf()
+        form_conn.close()
+        
+        merged['home_last10_wins'] = form['home_last10_wins'].fillna(0.5).to_numpy()
+        merged['away_last10_wins'] = form['away_last10_wins'].fillna(0.5).to_numpy()
         
         # ELO features
         merged['elo_diff'] = merged['elo_home_before'] - merged['elo_away_before']
@@ -129,14 +148,13 @@ class NBAMLTrainerV2:
         # Odds features (with fallback)
         merged['spread_num'] = pd.to_numeric(merged['spread'], errors='coerce')
         merged['over_under'] = pd.to_numeric(merged['over_under'], errors='coerce')
-        merged['ml_home_prob'] = merged['ml_home'].apply(self.american_odds_to_prob)
-        merged['ml_away_prob'] = merged['ml_away'].apply(self.american_odds_to_prob)
+        merged['ml_home_prob'] = self.american_odds_to_prob(merged['ml_home'])
+        merged['ml_away_prob'] = self.american_odds_to_prob(merged['ml_away'])
         
         # Fill missing odds with defaults
         merged['spread_num'] = merged['spread_num'].fillna(0)
         merged['over_under'] = merged['over_under'].fillna(220)
         merged['ml_home_prob'] = merged['ml_home_prob'].fillna(0.5)
-        merged['ml_home_prob'] = merged['ml_home_prob'].fillna(0.5)
         merged['ml_away_prob'] = merged['ml_away_prob'].fillna(0.5)
         
         # Flag for odds availability
@@ -169,17 +187,12 @@ class NBAMLTrainerV2:
         return model_data, feature_cols
     
     def american_odds_to_prob(self, odds):
-        """Convert American odds to implied probability"""
-        if pd.isna(odds):
-            return 0.5
-        try:
-            odds = float(odds)
-            if odds > 0:
-                return 100 / (odds + 100)
-            else:
-                return abs(odds) / (abs(odds) + 100)
-        except:
-            return 0.5
+        """Convert a column of American odds to implied probability"""
+        # Underdogs (+150) -> 100/250, favorites (-150) -> 150/250, unparseable -> 0.5
+        odds = pd.to_numeric(odds, errors='coerce').to_numpy(dtype=np.float64)
+        prob = np.empty_like(odds)
+        odds_to_prob(odds, prob)
+        return prob
     
     def train_model(self, model_data, feature_cols):
         """Train model"""
@@ -187,44 +200,40 @@ class NBAMLTrainerV2:
         print('Training NBA ML Model V2')
         print('='*70)
         
-        X = model_data[feature_cols]
-        y = model_data['home_win']
-        
         # Split by date to avoid data leakage
         split_date = model_data['date'].quantile(0.8)
         train_data = model_data[model_data['date'] < split_date]
         test_data = model_data[model_data['date'] >= split_date]
         
-        X_train = train_data[feature_cols]
+        X_train = train_data[feature_cols].to_numpy(dtype=np.float32)
         y_train = train_data['home_win']
-        X_test = test_data[feature_cols]
+        X_test = test_data[feature_cols].to_numpy(dtype=np.float32)
         y_test = test_data['home_win']
         
         print(f'Training set: {len(X_train)} samples')
         print(f'Test set: {len(X_test)} samples')
         print(f'Test date range: {test_data["date"].min()} to {test_data["date"].max()}')
         
-        # Scale features
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        
-        # Train model
+        # Train model (tree splits are scale invariant, so no StandardScaler pass)
         print('\nTraining Gradient Boosting Classifier...')
         model = GradientBoostingClassifier(
             n_estimators=300,
             max_depth=6,
             learning_rate=0.08,
             random_state=42,
-            subsample=0.8
+            subsample=0.8,
+            n_iter_no_change=10,
+            validation_fraction=0.1,
+            tol=1e-4
         )
         
-        model.fit(X_train_scaled, y_train)
+        model.fit(X_train, y_train)
+        print(f'Boosting iterations: {model.n_estimators_}')
         
         # Evaluate
-        train_pred = model.predict(X_train_scaled)
-        test_pred = model.predict(X_test_scaled)
-        test_pred_proba = model.predict_proba(X_test_scaled)[:, 1]
+        train_pred = model.predict(X_train)
+        test_pred = model.predict(X_test)
+        test_pred_proba = model.predict_proba(X_test)[:, 1]
         
         print('\n' + '-'*70)
         print('Results:')
@@ -257,26 +266,31 @@ class NBAMLTrainerV2:
         # Save model
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         model_path = f'{self.models_dir}/nba_model_v2_{timestamp}.joblib'
-        scaler_path = f'{self.models_dir}/scaler_v2_{timestamp}.joblib'
         
         joblib.dump(model, model_path)
-        joblib.dump(scaler, scaler_path)
         
         print(f'\nModel saved: {model_path}')
-        print(f'Scaler saved: {scaler_path}')
         
-        return model, scaler, feature_cols
+        # Compiled ONNX graph for batch predict (joblib stays the fallback)
+        try:
+            onnx_path = export_onnx(model, None, model_path)
+            if onnx_path is not None:
+                print(f'ONNX saved: {onnx_path}')
+        except Exception as e:
+            print(f'ONNX export failed, joblib model only: {type(e).__name__}')
+        
+        return model, feature_cols
     
     def run(self):
         """Main execution"""
-        games_df, odds_df = self.load_data()
-        model_data, feature_cols = self.engineer_features(games_df, odds_df)
+        merged = self.load_data()
+        model_data, feature_cols = self.engineer_features(merged)
         
         if len(model_data) < 1000:
             print(f'ERROR: Only {len(model_data)} samples. Need more data.')
             return
         
-        model, scaler, features = self.train_model(model_data, feature_cols)
+        model, features = self.train_model(model_data, feature_cols)
         
         print('\n' + '='*70)
         print('TRAINING COMPLETE')
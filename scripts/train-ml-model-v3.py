@@ -10,17 +10,46 @@ import duckdb
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.metrics import accuracy_score, classification_report, roc_auc_score
-from sklearn.preprocessing import StandardScaler
+from sklearn.inspection import permutation_importance
 import joblib
+import hashlib
+import io
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from datetime import datetime
+from pathlib import Path
+from threadpoolctl import threadpool_limits
+
+from model_utils import export_onnx
+
+# Parquet snapshots of the engineered feature frame
+FEATURE_CACHE_DIR = Path('./.cache/features')
+
+# Bump whenever load_data/engineer_features change what they produce; part of the cache key
+FEATURE_VERSION = 1
+
+def run_captured(model_name, fn, *args):
+    """Run fn in a worker process and return what it printed, so parallel logs don't interleave"""
+    log = io.StringIO()
+    try:
+        # Two fits share the machine: give each half of the cores
+        with redirect_stdout(log), threadpool_limits(limits=max(1, (os.cpu_count() or 2) // 2)):
+            fn(*args)
+    except Exception as e:
+        # Keep the log up to the failure, and say which model failed
+        print(log.getvalue(), end='', flush=True)
+        raise RuntimeError(f'{model_name} model training failed: {e}') from e
+    return log.getvalue()
 
 class NBAMLTrainerV3:
     def __init__(self):
         self.db_path = './nba-data/analytics.duckdb'
         self.models_dir = './models'
+        self.conn = None
         os.makedirs(self.models_dir, exist_ok=True)
         
         # Seasons to exclude (no odds)
@@ -33,12 +62,8 @@ class NBAMLTrainerV3:
         print(f'Excluding seasons: {self.EXCLUDED_SEASONS}')
         print('='*70)
         
-        conn = duckdb.connect(self.db_path)
-        
-        # Load games with ELO, excluding seasons without odds
-        placeholders = ','.join([str(s) for s in self.EXCLUDED_SEASONS])
-        
-        games_query = f"""
+        # Load games with ELO, excluding seasons without odds (bound as one INTEGER[] parameter)
+        games_query = """
             SELECT 
                 game_id,
                 date,
@@ -53,11 +78,11 @@ class NBAMLTrainerV3:
                 CASE WHEN home_score > away_score THEN 1 ELSE 0 END as home_win
             FROM github_games
             WHERE elo_home_before IS NOT NULL
-            AND season NOT IN ({placeholders})
+            AND season NOT IN (SELECT UNNEST(?::INTEGER[]))
             ORDER BY date
         """
         
-        games_df = conn.execute(games_query).fetchdf()
+        games_df = self.conn.execute(games_query, [self.EXCLUDED_SEASONS]).arrow().read_pandas(types_mapper=pd.ArrowDtype)
         print(f'\nLoaded {len(games_df)} games (excluded {self.EXCLUDED_SEASONS})')
         
         # Show distribution by season
@@ -67,7 +92,7 @@ class NBAMLTrainerV3:
             print(f'  {int(row["season"])}: {row["count"]} games')
         
         # Load odds
-        odds_query = f"""
+        odds_query = """
             SELECT 
                 season,
                 date,
@@ -78,14 +103,12 @@ class NBAMLTrainerV3:
                 ml_home,
                 ml_away
             FROM odds_historical
-            WHERE season NOT IN ({placeholders})
+            WHERE season NOT IN (SELECT UNNEST(?::INTEGER[]))
         """
         
-        odds_df = conn.execute(odds_query).fetchdf()
+        odds_df = self.conn.execute(odds_query, [self.EXCLUDED_SEASONS]).arrow().read_pandas(types_mapper=pd.ArrowDtype)
         print(f'\nLoaded {len(odds_df)} odds entries')
         
-        conn.close()
-        
         return games_df, odds_df
     
     def engineer_features(self, games_df, odds_df):
@@ -94,70 +117,71 @@ class NBAMLTrainerV3:
         print('Engineering features...')
         print('='*70)
         
-        conn = duckdb.connect(self.db_path)
-        mapping_df = conn.execute('SELECT * FROM team_mapping').fetchdf()
-        conn.close()
-        
-        team_map = dict(zip(mapping_df['abbreviation'].str.upper(), 
-                           mapping_df['full_name'].str.lower()))
-        
-        # Map team names for 2010-2015
-        def map_team_name(team):
-            team = str(team).strip().upper()
-            if team in team_map:
-                return team_map[team]
-            return str(team).lower().strip()
-        
-        games_df['home_team_mapped'] = games_df['home_team'].apply(map_team_name)
-        games_df['away_team_mapped'] = games_df['away_team'].apply(map_team_name)
-        
-        odds_df['home_team_clean'] = odds_df['home_team'].str.strip().str.lower()
-        odds_df['away_team_clean'] = odds_df['away_team'].str.strip().str.lower()
-        
-        # Merge
+        # Team-name mapping, odds join, form windows and odds features in one DuckDB query.
+        # Abbreviations (2010-2015) map through team_mapping, full names are trimmed/lowercased.
+        # Rows are ordered by date, then game and odds order, before the form windows.
         print('Merging games with odds...')
-        merged = games_df.merge(
-            odds_df[['season', 'home_team_clean', 'away_team_clean', 
-                    'spread', 'over_under', 'ml_home', 'ml_away']],
-            left_on=['season', 'home_team_mapped', 'away_team_mapped'],
-            right_on=['season', 'home_team_clean', 'away_team_clean'],
-            how='inner'  # Only keep games with odds
-        )
+        self.conn.register('games_tmp', games_df.assign(game_row=np.arange(len(games_df))))
+        self.conn.register('odds_tmp', odds_df.assign(odds_row=np.arange(len(odds_df))))
+        self.conn.execute('''
+            CREATE OR REPLACE TEMP MACRO odds_prob(odds) AS
+                CASE 
+                    WHEN odds IS NULL THEN 0.5
+                    WHEN odds > 0 THEN 100 / (odds + 100)
+                    ELSE abs(odds) / (abs(odds) + 100)
+                END
+        ''')
+        merged = self.conn.execute('''
+            WITH team_map AS (
+                SELECT 
+                    upper(abbreviation) as abbreviation,
+                    arg_max(lower(full_name), rowid) as full_name
+                FROM team_mapping
+                GROUP BY upper(abbreviation)
+            ),
+            games AS (
+                SELECT 
+                    g.*,
+                    COALESCE(th.full_name, lower(trim(g.home_team))) as home_team_mapped,
+                    COALESCE(ta.full_name, lower(trim(g.away_team))) as away_team_mapped
+                FROM games_tmp g
+                LEFT JOIN team_map th ON th.abbreviation = upper(trim(g.home_team))
+                LEFT JOIN team_map ta ON ta.abbreviation = upper(trim(g.away_team))
+            )
+            SELECT 
+                g.* EXCLUDE (game_row),
+                o.spread,
+                o.over_under,
+                o.ml_home,
+                o.ml_away,
+                COALESCE(AVG(g.home_win) OVER (
+                    PARTITION BY g.home_team ORDER BY g.date, g.game_row, o.odds_row
+                    ROWS BETWEEN 10 PRECEDING AND 1 PRECEDING
+                ), 0.5) as home_last10_wins,
+                COALESCE(AVG(1 - g.home_win) OVER (
+                    PARTITION BY g.away_team ORDER BY g.date, g.game_row, o.odds_row
+                    ROWS BETWEEN 10 PRECEDING AND 1 PRECEDING
+                ), 0.5) as away_last10_wins,
+                g.elo_home_before - g.elo_away_before as elo_diff,
+                (g.elo_home_before - g.elo_away_before + 400) / 800 as elo_diff_norm,
+                o.spread as spread_num,
+                odds_prob(TRY_CAST(o.ml_home AS DOUBLE)) as ml_home_prob,
+                odds_prob(TRY_CAST(o.ml_away AS DOUBLE)) as ml_away_prob,
+                2 as rest_days_home,
+                2 as rest_days_away,
+                (g.season - 2010) / 15 as season_norm
+            FROM games g
+            JOIN odds_tmp o
+                ON o.season = g.season
+                AND lower(trim(o.home_team)) = g.home_team_mapped
+                AND lower(trim(o.away_team)) = g.away_team_mapped
+            ORDER BY g.date, g.game_row, o.odds_row
+        ''').fetchdf()
+        self.conn.unregister('games_tmp')
+        self.conn.unregister('odds_tmp')
         
         print(f'  Total games with odds: {len(merged)}')
         
-        # Calculate features
-        print('Calculating features...')
-        merged = merged.sort_values('date')
-        
-        # Rolling form (last 10 games)
-        merged['home_last10_wins'] = merged.groupby('home_team')['home_win'].transform(
-            lambda x: x.shift(1).rolling(window=10, min_periods=1).mean()
-        ).fillna(0.5)
-        
-        merged['away_last10_wins'] = merged.groupby('away_team')['home_win'].transform(
-            lambda x: (1 - x).shift(1).rolling(window=10, min_periods=1).mean()
-        ).fillna(0.5)
-        
-        # ELO features
-        merged['elo_diff'] = merged['elo_home_before'] - merged['elo_away_before']
-        
-        # Normalize ELO to 0-1 range
-        merged['elo_diff_norm'] = (merged['elo_diff'] + 400) / 800  # Rough normalization
-        
-        # Odds features
-        merged['spread_num'] = pd.to_numeric(merged['spread'], errors='coerce')
-        merged['over_under'] = pd.to_numeric(merged['over_under'], errors='coerce')
-        merged['ml_home_prob'] = merged['ml_home'].apply(self.american_odds_to_prob)
-        merged['ml_away_prob'] = merged['ml_away'].apply(self.american_odds_to_prob)
-        
-        # Rest days
-        merged['rest_days_home'] = 2
-        merged['rest_days_away'] = 2
-        
-        # SEASON as feature (NEW!)
-        merged['season_norm'] = (merged['season'] - 2010) / 15  # Normalize to 0-1
-        
         # Features
         feature_cols = [
             'elo_diff',
@@ -178,18 +202,32 @@ class NBAMLTrainerV3:
         
         return merged, feature_cols
     
-    def american_odds_to_prob(self, odds):
-        """Convert American odds to probability"""
-        if pd.isna(odds):
-            return 0.5
-        try:
-            odds = float(odds)
-            if odds > 0:
-                return 100 / (odds + 100)
-            else:
-                return abs(odds) / (abs(odds) + 100)
-        except:
-            return 0.5
+    def feature_cache_path(self):
+        """Feature snapshot path, keyed on the input tables and FEATURE_VERSION"""
+        # Row counts + latest dates change whenever games or odds are re-imported;
+        # the ELO count/sums also move when import-elo-complete.py UPDATEs github_games in place
+        inputs_state = (
+            self.conn.execute('''
+                SELECT COUNT(*), MAX(date), COUNT(elo_home_before), SUM(elo_home_before), SUM(elo_away_before)
+                FROM github_games
+            ''').fetchone()
+            + self.conn.execute('SELECT COUNT(*), MAX(date), SUM(spread), SUM(over_under) FROM odds_historical').fetchone()
+            + self.conn.execute('SELECT COUNT(*) FROM team_mapping').fetchone()
+        )
+        key = hashlib.md5(repr((inputs_state, self.EXCLUDED_SEASONS, FEATURE_VERSION)).encode()).hexdigest()[:12]
+        return FEATURE_CACHE_DIR / f'features_v3_{key}.parquet'
+    
+    def save_feature_cache(self, cache_path, model_data, feature_cols):
+        """Write the feature frame and its column list, replacing older snapshots"""
+        FEATURE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old_path in FEATURE_CACHE_DIR.glob('features_v3_*'):
+            old_path.unlink(missing_ok=True)
+        cache_path.with_suffix('.json').write_text(json.dumps(feature_cols))
+        
+        # Parquet goes last (atomic rename): its presence marks a complete snapshot
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+        model_data.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
     
     def train_model(self, model_data, feature_cols, model_name='global'):
         """Train and save model"""
@@ -197,42 +235,39 @@ class NBAMLTrainerV3:
         print(f'Training {model_name.upper()} Model')
         print('='*70)
         
-        X = model_data[feature_cols]
-        y = model_data['home_win']
-        
-        # Time-based split
-        split_date = model_data['date'].quantile(0.8)
-        train_data = model_data[model_data['date'] < split_date]
-        test_data = model_data[model_data['date'] >= split_date]
+        # Time-based split: rows are date-sorted, so cut at 80% by position,
+        # moved back to the first game of that date so no date spans both sets
+        dates = model_data['date'].to_numpy()
+        cut = dates.searchsorted(dates[int(len(dates) * 0.8)], side='left')
+        train_data = model_data.iloc[:cut]
+        test_data = model_data.iloc[cut:]
         
-        X_train = train_data[feature_cols]
+        X_train = train_data[feature_cols].to_numpy(dtype=np.float32)
         y_train = train_data['home_win']
-        X_test = test_data[feature_cols]
+        X_test = test_data[feature_cols].to_numpy(dtype=np.float32)
         y_test = test_data['home_win']
         
         print(f'Training: {len(X_train)} samples ({train_data["date"].min()} to {train_data["date"].max()})')
         print(f'Test: {len(X_test)} samples ({test_data["date"].min()} to {test_data["date"].max()})')
         
-        # Scale
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        
-        # Train
-        print('\nTraining Gradient Boosting...')
-        model = GradientBoostingClassifier(
-            n_estimators=300,
+        # Train (histogram GBM bins raw features, no scaling needed)
+        print('\nTraining Histogram Gradient Boosting...')
+        model = HistGradientBoostingClassifier(
+            max_iter=300,
             max_depth=6,
             learning_rate=0.08,
+            early_stopping=True,
+            validation_fraction=0.1,
             random_state=42
         )
         
-        model.fit(X_train_scaled, y_train)
+        model.fit(X_train, y_train)
+        print(f'Boosting iterations: {model.n_iter_}')
         
         # Evaluate
-        train_pred = model.predict(X_train_scaled)
-        test_pred = model.predict(X_test_scaled)
-        test_pred_proba = model.predict_proba(X_test_scaled)[:, 1]
+        train_pred = model.predict(X_train)
+        test_pred = model.predict(X_test)
+        test_pred_proba = model.predict_proba(X_test)[:, 1]
         
         print('\n' + '-'*70)
         print('Results:')
@@ -245,11 +280,13 @@ class NBAMLTrainerV3:
         print(classification_report(y_test, test_pred, 
                                   target_names=['Away Win', 'Home Win']))
         
-        # Feature importance
+        # Feature importance (permutation on the test set)
         print('\nFeature Importance:')
         importance = pd.DataFrame({
             'feature': feature_cols,
-            'importance': model.feature_importances_
+            'importance': permutation_importance(
+                model, X_test, y_test, n_repeats=5, random_state=42
+            ).importances_mean
         }).sort_values('importance', ascending=False)
         
         for _, row in importance.iterrows():
@@ -258,73 +295,33 @@ class NBAMLTrainerV3:
         # Save
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         model_path = f'{self.models_dir}/nba_model_v3_{model_name}_{timestamp}.joblib'
-        scaler_path = f'{self.models_dir}/scaler_v3_{model_name}_{timestamp}.joblib'
         
         joblib.dump(model, model_path)
-        joblib.dump(scaler, scaler_path)
         
         print(f'\nModel saved: {model_path}')
-        print(f'Scaler saved: {scaler_path}')
         
-        return model, scaler
+        # ONNX copy for faster loading and inference
+        try:
+            onnx_path = export_onnx(model, None, model_path)
+            if onnx_path is not None:
+                print(f'ONNX saved: {onnx_path}')
+        except Exception as e:
+            print(f'ONNX export failed, joblib model only: {type(e).__name__}')
+        
+        return model
     
-    def train_2025_model(self, games_df, odds_df, feature_cols):
+    def train_2025_model(self, model_data, feature_cols):
         """Train model specifically for 2025"""
         print('\n' + '='*70)
         print('Creating 2025-Specific Model')
         print('='*70)
         
-        # Filter for seasons similar to 2025 (2019-2023)
+        # Filter for seasons similar to 2025 (2019-2023); features come from the global pass
         recent_seasons = [2019, 2020, 2021, 2022, 2023]
-        
-        # Re-merge but only for recent seasons
-        conn = duckdb.connect(self.db_path)
-        mapping_df = conn.execute('SELECT * FROM team_mapping').fetchdf()
-        conn.close()
-        
-        team_map = dict(zip(mapping_df['abbreviation'].str.upper(), 
-                           mapping_df['full_name'].str.lower()))
-        
-        def map_team_name(team):
-            team = str(team).strip().upper()
-            if team in team_map:
-                return team_map[team]
-            return str(team).lower().strip()
-        
-        games_recent = games_df[games_df['season'].isin(recent_seasons)].copy()
-        odds_recent = odds_df[odds_df['season'].isin(recent_seasons)].copy()
-        
-        games_recent['home_team_mapped'] = games_recent['home_team'].apply(map_team_name)
-        games_recent['away_team_mapped'] = games_recent['away_team'].apply(map_team_name)
-        odds_recent['home_team_clean'] = odds_recent['home_team'].str.strip().str.lower()
-        odds_recent['away_team_clean'] = odds_recent['away_team'].str.strip().str.lower()
-        
-        merged = games_recent.merge(
-            odds_recent[['season', 'home_team_clean', 'away_team_clean', 
-                        'spread', 'over_under', 'ml_home', 'ml_away']],
-            left_on=['season', 'home_team_mapped', 'away_team_mapped'],
-            right_on=['season', 'home_team_clean', 'away_team_clean'],
-            how='inner'
-        )
+        merged = model_data[model_data['season'].isin(recent_seasons)].copy()
         
         print(f'Recent seasons data: {len(merged)} games')
         
-        # Calculate same features
-        merged = merged.sort_values('date')
-        merged['home_last10_wins'] = merged.groupby('home_team')['home_win'].transform(
-            lambda x: x.shift(1).rolling(window=10, min_periods=1).mean()
-        ).fillna(0.5)
-        merged['away_last10_wins'] = merged.groupby('away_team')['home_win'].transform(
-            lambda x: (1 - x).shift(1).rolling(window=10, min_periods=1).mean()
-        ).fillna(0.5)
-        merged['elo_diff'] = merged['elo_home_before'] - merged['elo_away_before']
-        merged['elo_diff_norm'] = (merged['elo_diff'] + 400) / 800
-        merged['spread_num'] = pd.to_numeric(merged['spread'], errors='coerce')
-        merged['over_under'] = pd.to_numeric(merged['over_under'], errors='coerce')
-        merged['ml_home_prob'] = merged['ml_home'].apply(self.american_odds_to_prob)
-        merged['ml_away_prob'] = merged['ml_away'].apply(self.american_odds_to_prob)
-        merged['rest_days_home'] = 2
-        merged['rest_days_away'] = 2
         merged['season_norm'] = (merged['season'] - 2019) / 4  # Normalize for recent
         
         # Train
@@ -332,18 +329,42 @@ class NBAMLTrainerV3:
     
     def run(self):
         """Main execution"""
-        games_df, odds_df = self.load_data()
-        model_data, feature_cols = self.engineer_features(games_df, odds_df)
+        # One read-only connection for loading and feature engineering
+        self.conn = duckdb.connect(self.db_path, read_only=True)
+        try:
+            # Reuse the feature frame when neither the inputs nor the feature code changed
+            cache_path = self.feature_cache_path()
+            if cache_path.exists():
+                print(f'Using cached features: {cache_path}')
+                model_data = pd.read_parquet(cache_path)
+                feature_cols = json.loads(cache_path.with_suffix('.json').read_text())
+            else:
+                games_df, odds_df = self.load_data()
+                model_data, feature_cols = self.engineer_features(games_df, odds_df)
+                self.save_feature_cache(cache_path, model_data, feature_cols)
+        finally:
+            self.conn.close()
+            self.conn = None  # workers get a pickled copy of the trainer
         
         if len(model_data) < 1000:
             print(f'ERROR: Only {len(model_data)} samples')
             return
         
-        # Train global model
-        self.train_model(model_data, feature_cols, 'global')
-        
-        # Train 2025-specific model
-        self.train_2025_model(games_df, odds_df, feature_cols)
+        # Global and 2025-specific models are independent fits: train them in two
+        # processes, then print each log in order
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(run_captured, 'global', self.train_model, model_data, feature_cols, 'global'),
+                executor.submit(run_captured, '2025', self.train_2025_model, model_data, feature_cols)
+            ]
+            for future in futures:
+                if future.exception() is None:
+                    print(future.result(), end='')
+        
+        # Failed fits printed their log from the worker; report the first failure
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
         
         print('\n' + '='*70)
         print('TRAINING COMPLETE - Both models saved!')
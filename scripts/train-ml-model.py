@@ -8,9 +8,9 @@ import duckdb
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
 from sklearn.metrics import accuracy_score, classification_report, roc_auc_score
-from sklearn.preprocessing import StandardScaler
+from sklearn.inspection import permutation_importance
 import joblib
 import os
 from datetime import datetime
@@ -19,12 +19,12 @@ class NBAMLTrainer:
     def __init__(self):
         self.db_path = './nba-data/analytics.duckdb'
         self.models_dir = './models'
+        self.conn = None
         os.makedirs(self.models_dir, exist_ok=True)
         
     def load_data(self):
         """Load and merge all data sources"""
         print('Loading data...')
-        conn = duckdb.connect(self.db_path)
         
         # Load games with ELO ratings
         games_query = """
@@ -47,7 +47,7 @@ class NBAMLTrainer:
             ORDER BY date
         """
         
-        games_df = conn.execute(games_query).fetchdf()
+        games_df = self.conn.execute(games_query).arrow().read_pandas(types_mapper=pd.ArrowDtype)
         print(f'Loaded {len(games_df)} games')
         
         # Load historical odds
@@ -66,76 +66,77 @@ class NBAMLTrainer:
             WHERE season >= 2010
         """
         
-        odds_df = conn.execute(odds_query).fetchdf()
+        odds_df = self.conn.execute(odds_query).arrow().read_pandas(types_mapper=pd.ArrowDtype)
         print(f'Loaded {len(odds_df)} odds entries')
         
-        conn.close()
-        
         return games_df, odds_df
     
     def engineer_features(self, games_df, odds_df):
         """Create ML features with team name mapping"""
         print('\nEngineering features...')
         
-        # Load team mapping
-        print('Loading team name mapping...')
-        conn = duckdb.connect(self.db_path)
-        mapping_df = conn.execute('SELECT * FROM team_mapping').fetchdf()
-        conn.close()
-        
-        # Create mapping dictionary
-        team_map = dict(zip(mapping_df['abbreviation'].str.upper(), mapping_df['full_name'].str.lower()))
-        
-        # Map games team names from abbreviations to full names
-        games_df['home_team_mapped'] = games_df['home_team'].map(team_map)
-        games_df['away_team_mapped'] = games_df['away_team'].map(team_map)
-        
-        # Normalize odds team names
-        odds_df['home_team_clean'] = odds_df['home_team'].str.strip().str.lower()
-        odds_df['away_team_clean'] = odds_df['away_team'].str.strip().str.lower()
-        
-        # Merge using mapped names
+        # Team-name mapping, odds join, form windows and odds features in one DuckDB query.
+        # Game abbreviations map to full names via team_mapping; odds names are trimmed/lowercased.
+        # Rows are ordered by date, then game and odds order, before the form windows.
         print('Merging games with odds...')
-        merged = games_df.merge(
-            odds_df[['season', 'home_team_clean', 'away_team_clean', 'spread', 'over_under', 'ml_home', 'ml_away']],
-            left_on=['season', 'home_team_mapped', 'away_team_mapped'],
-            right_on=['season', 'home_team_clean', 'away_team_clean'],
-            how='left'
-        )
+        self.conn.register('games_tmp', games_df.assign(game_row=np.arange(len(games_df))))
+        self.conn.register('odds_tmp', odds_df.assign(odds_row=np.arange(len(odds_df))))
+        self.conn.execute('''
+            CREATE OR REPLACE TEMP MACRO odds_prob(odds) AS
+                CASE 
+                    WHEN odds IS NULL THEN 0.5
+                    WHEN odds > 0 THEN 100 / (odds + 100)
+                    ELSE abs(odds) / (abs(odds) + 100)
+                END
+        ''')
+        merged = self.conn.execute('''
+            WITH team_map AS (
+                SELECT 
+                    upper(abbreviation) as abbreviation,
+                    arg_max(lower(full_name), rowid) as full_name
+                FROM team_mapping
+                GROUP BY upper(abbreviation)
+            )
+            SELECT 
+                g.* EXCLUDE (game_row),
+                o.spread,
+                o.over_under,
+                o.ml_home,
+                o.ml_away,
+                AVG(g.home_win) OVER (
+                    PARTITION BY g.home_team ORDER BY g.date, g.game_row, o.odds_row
+                    ROWS BETWEEN 10 PRECEDING AND 1 PRECEDING
+                ) as home_last10_wins,
+                AVG(1 - g.home_win) OVER (
+                    PARTITION BY g.away_team ORDER BY g.date, g.game_row, o.odds_row
+                    ROWS BETWEEN 10 PRECEDING AND 1 PRECEDING
+                ) as away_last10_wins,
+                g.elo_home_before - g.elo_away_before as elo_diff,
+                o.spread as spread_num,
+                odds_prob(TRY_CAST(o.ml_home AS DOUBLE)) as ml_home_prob,
+                odds_prob(TRY_CAST(o.ml_away AS DOUBLE)) as ml_away_prob,
+                2 as rest_days_home,
+                2 as rest_days_away,
+                th.full_name as home_team_name,
+                ta.full_name as away_team_name
+            FROM games_tmp g
+            LEFT JOIN team_map th ON th.abbreviation = g.home_team
+            LEFT JOIN team_map ta ON ta.abbreviation = g.away_team
+            LEFT JOIN odds_tmp o
+                ON o.season = g.season
+                AND lower(trim(o.home_team)) = th.full_name
+                AND lower(trim(o.away_team)) = ta.full_name
+            ORDER BY g.date, g.game_row, o.odds_row
+        ''').fetchdf()
+        self.conn.unregister('games_tmp')
+        self.conn.unregister('odds_tmp')
         
         print(f'Merged data: {len(merged)} rows')
         print(f'With odds: {merged["spread"].notna().sum()} rows')
         
-        # Calculate rolling features (last 10 games)
-        merged = merged.sort_values('date')
-        
-        # Home team form
-        merged['home_last10_wins'] = merged.groupby('home_team')['home_win'].transform(
-            lambda x: x.shift(1).rolling(window=10, min_periods=1).mean()
-        )
-        
-        # Away team form (need to calculate from when they were home)
-        away_form = merged.copy()
-        away_form['away_win'] = 1 - away_form['home_win']
-        away_form['team'] = away_form['away_team']
-        
-        merged['away_last10_wins'] = merged.groupby('away_team')['home_win'].transform(
-            lambda x: (1 - x).shift(1).rolling(window=10, min_periods=1).mean()
-        )
-        
-        # ELO difference
-        merged['elo_diff'] = merged['elo_home_before'] - merged['elo_away_before']
-        
-        # Convert spread to numeric
-        merged['spread_num'] = pd.to_numeric(merged['spread'], errors='coerce')
-        
-        # Convert moneyline to implied probability
-        merged['ml_home_prob'] = merged['ml_home'].apply(self.american_odds_to_prob)
-        merged['ml_away_prob'] = merged['ml_away'].apply(self.american_odds_to_prob)
-        
-        # Rest days (simplified - assume 2 days if not in odds data)
-        merged['rest_days_home'] = 2
-        merged['rest_days_away'] = 2
+        # Team identity as categoricals (lowercased full names, same as the odds feed)
+        merged['home_team_name'] = merged['home_team_name'].astype('category')
+        merged['away_team_name'] = merged['away_team_name'].astype('category')
         
         # Features for model
         feature_cols = [
@@ -147,7 +148,9 @@ class NBAMLTrainer:
             'ml_home_prob',
             'ml_away_prob',
             'rest_days_home',
-            'rest_days_away'
+            'rest_days_away',
+            'home_team_name',
+            'away_team_name'
         ]
         
         # Drop rows with missing features
@@ -158,27 +161,16 @@ class NBAMLTrainer:
         
         return model_data, feature_cols
     
-    def american_odds_to_prob(self, odds):
-        """Convert American odds to implied probability"""
-        if pd.isna(odds):
-            return 0.5
-        
-        try:
-            odds = float(odds)
-            if odds > 0:
-                return 100 / (odds + 100)
-            else:
-                return abs(odds) / (abs(odds) + 100)
-        except:
-            return 0.5
-    
     def train_model(self, model_data, feature_cols):
         """Train ML model"""
         print('\n' + '='*65)
         print('Training NBA ML Model')
         print('='*65)
         
-        X = model_data[feature_cols]
+        # Numeric features as float32; team columns stay categorical
+        X = model_data[feature_cols].astype({
+            col: np.float32 for col in feature_cols if col not in ('home_team_name', 'away_team_name')
+        })
         y = model_data['home_win']
         
         # Split data
@@ -189,26 +181,26 @@ class NBAMLTrainer:
         print(f'Training set: {len(X_train)} samples')
         print(f'Test set: {len(X_test)} samples')
         
-        # Scale features
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        
-        # Train Gradient Boosting model
-        print('\nTraining Gradient Boosting Classifier...')
-        model = GradientBoostingClassifier(
-            n_estimators=200,
+        # Train Histogram Gradient Boosting model (scale invariant, fed raw features;
+        # teams are split on natively as categories)
+        print('\nTraining Histogram Gradient Boosting Classifier...')
+        model = HistGradientBoostingClassifier(
+            max_iter=200,
             max_depth=5,
             learning_rate=0.1,
+            early_stopping=True,
+            validation_fraction=0.1,
+            categorical_features='from_dtype',
             random_state=42
         )
         
-        model.fit(X_train_scaled, y_train)
+        model.fit(X_train, y_train)
+        print(f'Boosting iterations: {model.n_iter_}')
         
         # Evaluate
-        train_pred = model.predict(X_train_scaled)
-        test_pred = model.predict(X_test_scaled)
-        test_pred_proba = model.predict_proba(X_test_scaled)[:, 1]
+        train_pred = model.predict(X_train)
+        test_pred = model.predict(X_test)
+        test_pred_proba = model.predict_proba(X_test)[:, 1]
         
         print('\n' + '-'*65)
         print('Training Results:')
@@ -219,11 +211,13 @@ class NBAMLTrainer:
         print('\nClassification Report:')
         print(classification_report(y_test, test_pred, target_names=['Away Win', 'Home Win']))
         
-        # Feature importance
+        # Feature importance (permutation on the test set)
         print('\nFeature Importance:')
         importance = pd.DataFrame({
             'feature': feature_cols,
-            'importance': model.feature_importances_
+            'importance': permutation_importance(
+                model, X_test, y_test, n_repeats=5, random_state=42
+            ).importances_mean
         }).sort_values('importance', ascending=False)
         
         for _, row in importance.iterrows():
@@ -232,26 +226,28 @@ class NBAMLTrainer:
         # Save model
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         model_path = f'{self.models_dir}/nba_model_{timestamp}.joblib'
-        scaler_path = f'{self.models_dir}/scaler_{timestamp}.joblib'
         
         joblib.dump(model, model_path)
-        joblib.dump(scaler, scaler_path)
         
         print(f'\nModel saved to: {model_path}')
-        print(f'Scaler saved to: {scaler_path}')
         
-        return model, scaler, feature_cols
+        return model, feature_cols
     
     def run(self):
         """Main training pipeline"""
-        games_df, odds_df = self.load_data()
-        model_data, feature_cols = self.engineer_features(games_df, odds_df)
+        # One read-only connection for loading and feature engineering
+        self.conn = duckdb.connect(self.db_path, read_only=True)
+        try:
+            games_df, odds_df = self.load_data()
+            model_data, feature_cols = self.engineer_features(games_df, odds_df)
+        finally:
+            self.conn.close()
         
         if len(model_data) < 1000:
             print(f'\n⚠️ Warning: Only {len(model_data)} samples available. Need more data.')
             return
         
-        model, scaler, features = self.train_model(model_data, feature_cols)
+        model, features = self.train_model(model_data, feature_cols)
         
         print('\n' + '='*65)
         print('Training Complete!')
@@ -1,6 +1,12 @@
 import json
 from datetime import datetime
 
+# orjson is optional: fall back to the stdlib encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 report = {
     "meta": {
         "timestamp": datetime.now().isoformat() + "Z",
@@ -114,7 +120,13 @@ report = {
 timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
 output_path = f"C:\\Users\\isaac\\nba-analyst\\_bmad-output\\test-reviews\\performance-v2-{timestamp}.json"
 
-with open(output_path, 'w', encoding='utf-8') as f:
-    json.dump(report, f, indent=2)
+# Encode once, then a single write
+if orjson is not None:
+    report_bytes = orjson.dumps(report, option=orjson.OPT_INDENT_2, default=str)
+else:
+    report_bytes = json.dumps(report, indent=2, default=str).encode('utf-8')
+
+with open(output_path, 'wb') as f:
+    f.write(report_bytes)
 
 print(f"Report written to: {output_path}")